@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from .monitoring import CACHE_COALESCED, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """In-process cache bounded by entry count and total value bytes.
+
+    Entries expire after their TTL; when a bound is hit the least recently
+    used entries are evicted first.
+    """
+
+    def __init__(self, name, max_entries=10000, max_bytes=16 * 1024 * 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = await self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    async def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self.size_bytes += len(value)
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            CACHE_EVICTIONS.labels(cache=self.name).inc()
+
+    async def delete(self, key):
+        self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[1])
+
+
+class MemcachedCache:
+    """Minimal client for the memcached text protocol.
+
+    Shared by every worker, so invalidations are seen server-wide. Errors
+    are logged and treated as misses; the cache never fails a request.
+    """
+
+    def __init__(self, name, host="memcached", port=11211, timeout=0.25):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._reader = None
+        self._writer = None
+
+    async def _command(self, payload, read_reply):
+        async with self._lock:
+            complete = False
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout
+                    )
+                self._writer.write(payload)
+                reply = await asyncio.wait_for(read_reply(self._reader), self.timeout)
+                complete = True
+                return reply
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                logger.warning(f"memcached {self.host}:{self.port} unavailable: {e}")
+                return None
+            finally:
+                # A reply left unread (error, timeout or a cancelled caller)
+                # would be read by the next command as its own, so drop the
+                # connection instead of reusing it
+                if not complete:
+                    self._reset()
+
+    def _reset(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key):
+        async def read_reply(reader):
+            header = await reader.readline()
+            if not header.startswith(b"VALUE"):
+                return None
+            size = int(header.split()[3])
+            value = await reader.readexactly(size + 2)
+            await reader.readline()  # END
+            return value[:-2]
+
+        return await self._command(f"get {key}\r\n".encode(), read_reply)
+
+    async def get_many(self, keys):
+        # One multi-key get: a VALUE block for every hit, then END
+        async def read_reply(reader):
+            values = {}
+            while True:
+                header = await reader.readline()
+                if not header.startswith(b"VALUE"):
+                    return values
+                _, key, _, size = header.split()[:4]
+                value = await reader.readexactly(int(size) + 2)
+                values[key.decode()] = value[:-2]
+
+        if not keys:
+            return {}
+        return await self._command(f"get {' '.join(keys)}\r\n".encode(), read_reply) or {}
+
+    async def set(self, key, value, ttl):
+        header = f"set {key} 0 {max(int(ttl), 1)} {len(value)}\r\n".encode()
+        await self._command(header + value + b"\r\n", lambda reader: reader.readline())
+
+    async def delete(self, key):
+        await self._command(f"delete {key}\r\n".encode(), lambda reader: reader.readline())
+
+
+class ReadThroughCache:
+    """Read-through cache of JSON-serializable values.
+
+    Concurrent misses for the same key share one call to the loader.
+    """
+
+    def __init__(self, name, backend, ttl=30.0):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight = {}
+
+    async def get_or_load(self, key, loader):
+        key = f"{self.name}:{key}"
+        raw = await self.backend.get(key)
+        if raw is not None:
+            CACHE_HITS.labels(cache=self.name).inc()
+            return json.loads(raw)
+
+        load = self._inflight.get(key)
+        if load is None:
+            CACHE_MISSES.labels(cache=self.name).inc()
+            load = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = load
+            load.add_done_callback(lambda task: self._finish(key, task))
+        else:
+            CACHE_COALESCED.labels(cache=self.name).inc()
+        # Shield the shared load so one cancelled caller does not cancel it for all.
+        return await asyncio.shield(load)
+
+    async def _load(self, key, loader):
+        value = await loader()
+        # An invalidation during the load removed us from _inflight: the value
+        # may already be stale, so hand it to the waiters but do not store it.
+        if self._inflight.get(key) is asyncio.current_task():
+            await self.backend.set(key, json.dumps(value).encode(), self.ttl)
+        return value
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when every waiter has gone
+
+    async def lookup_many(self, keys):
+        """Return {key: value} for the cached keys, without loading the rest."""
+        names = {f"{self.name}:{key}": key for key in keys}
+        found = await self.backend.get_many(list(names))
+        CACHE_HITS.labels(cache=self.name).inc(len(found))
+        CACHE_MISSES.labels(cache=self.name).inc(len(names) - len(found))
+        return {names[name]: json.loads(raw) for name, raw in found.items()}
+
+    async def store(self, key, value):
+        await self.backend.set(f"{self.name}:{key}", json.dumps(value).encode(), self.ttl)
+
+    async def invalidate(self, key):
+        key = f"{self.name}:{key}"
+        self._inflight.pop(key, None)
+        await self.backend.delete(key)
+
+
+class NullCache:
+    """Pass-through used when caching is disabled."""
+
+    async def get_or_load(self, key, loader):
+        return await loader()
+
+    async def lookup_many(self, keys):
+        return {}
+
+    async def store(self, key, value):
+        pass
+
+    async def invalidate(self, key):
+        pass
+
+
+def create_cache(name, environ=os.environ):
+    backend = environ.get("PRODUCT_CACHE_BACKEND", "local").lower()
+    ttl = float(environ.get("PRODUCT_CACHE_TTL", "30"))
+    if backend == "none":
+        return NullCache()
+    if backend == "local":
+        return ReadThroughCache(name, LocalCache(
+            name,
+            max_entries=int(environ.get("PRODUCT_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(environ.get("PRODUCT_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+        ), ttl)
+    if backend == "memcached":
+        host, _, port = environ.get("MEMCACHED_ADDRESS", "memcached:11211").partition(":")
+        return ReadThroughCache(name, MemcachedCache(name, host, int(port or 11211)), ttl)
+    raise ValueError(f"Unknown cache backend '{backend}'")
@@ -0,0 +1,123 @@
+import bisect
+import heapq
+import json
+import os
+from array import array
+from collections import defaultdict
+from itertools import islice
+
+NGRAM = 3
+
+
+def normalize(text):
+    return text.lower()
+
+
+def ngrams(text, n=NGRAM):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class Catalog:
+    """Product catalog with an inverted index for name search.
+
+    Names are normalized once at load time and every query is a substring
+    match resolved through a trigram index. Queries of three or more
+    characters intersect the postings of their trigrams. A shorter query
+    occurs in a name only inside one of that name's trigrams, so its matches
+    are the merged postings of every trigram containing it (plus the rare
+    names shorter than a trigram). Either way the work done grows with the
+    number of matches read, not with the size of the catalog.
+    """
+
+    def __init__(self, products):
+        self.products = {}
+        for product in sorted(products, key=lambda p: p["id"]):
+            self.products[product["id"]] = product
+
+        # Positions are indexes into self._order, which is sorted by id, so
+        # every posting list is sorted too and results come back in id order.
+        self._order = list(self.products.values())
+        self._names = [normalize(product["name"]) for product in self._order]
+
+        # Postings go straight into 4-byte arrays: a list of Python ints
+        # costs several times more per entry at 1M products
+        grams = defaultdict(_posting)
+        self._short_names = _posting()
+        for position, name in enumerate(self._names):
+            if len(name) < NGRAM:
+                self._short_names.append(position)
+            for gram in ngrams(name):
+                grams[gram].append(position)
+        self._grams = dict(grams)
+
+        # For every 1- and 2-character substring, the trigrams containing it.
+        # Only distinct trigrams are walked, so this is cheap even at 1M products.
+        covering = defaultdict(list)
+        for gram in self._grams:
+            for size in range(1, NGRAM):
+                for sub in ngrams(gram, size):
+                    covering[sub].append(gram)
+        self._covering = dict(covering)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, product_id):
+        return product_id in self.products
+
+    def get(self, product_id):
+        return self.products.get(product_id)
+
+    def search(self, query, limit=20, offset=0):
+        query = normalize(query).strip()
+        if not query:
+            positions = iter(range(len(self._order)))
+        elif len(query) >= NGRAM:
+            positions = self._substring_matches(query)
+        else:
+            positions = self._short_matches(query)
+        return [self._order[position] for position in islice(positions, offset, offset + limit)]
+
+    def _substring_matches(self, query):
+        postings = []
+        for gram in ngrams(query):
+            posting = self._grams.get(gram)
+            if posting is None:
+                return
+            postings.append(posting)
+        postings.sort(key=len)
+        smallest, others = postings[0], postings[1:]
+        for position in smallest:
+            if all(_contains(posting, position) for posting in others) and query in self._names[position]:
+                yield position
+
+    def _short_matches(self, query):
+        postings = [self._grams[gram] for gram in self._covering.get(query, ())]
+        short = [position for position in self._short_names if query in self._names[position]]
+        last = None
+        for position in heapq.merge(*postings, short):
+            if position != last:
+                yield position
+                last = position
+
+
+def _posting():
+    return array("i")
+
+
+def _contains(posting, position):
+    i = bisect.bisect_left(posting, position)
+    return i < len(posting) and posting[i] == position
+
+
+def load_products(path):
+    """Read products from a JSON Lines file, one product object per line."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_catalog(default_products, environ=os.environ):
+    path = environ.get("CATALOG_PATH")
+    if path:
+        return Catalog(load_products(path))
+    return Catalog(default_products)
@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import threading
+from array import array
+from contextlib import ExitStack
+
+
+class InventoryError(Exception):
+    pass
+
+
+class UnknownProduct(InventoryError):
+    pass
+
+
+class OutOfStock(InventoryError):
+    pass
+
+
+class BatchRejected(InventoryError):
+    """A multi-product reservation failed; nothing was reserved.
+
+    ``failures`` maps each failing product id to "not_found" or "out_of_stock".
+    """
+
+    def __init__(self, failures):
+        super().__init__(failures)
+        self.failures = failures
+
+
+class InventoryStore:
+    """Stock counts per product with atomic reservations.
+
+    ``blocking`` tells async callers whether calls should be moved off the
+    event loop.
+    """
+
+    blocking = False
+
+    def get(self, product_id):
+        raise NotImplementedError
+
+    def get_many(self, product_ids):
+        return {product_id: self.get(product_id) for product_id in product_ids}
+
+    def reserve(self, product_id, quantity=1):
+        """Take ``quantity`` units if available and return the remaining stock."""
+        raise NotImplementedError
+
+    def reserve_many(self, quantities):
+        """Reserve ``{product_id: quantity}`` all-or-nothing.
+
+        Returns the remaining stock per product, or raises BatchRejected
+        without changing any stock.
+        """
+        raise NotImplementedError
+
+    def release(self, product_id, quantity=1):
+        """Put ``quantity`` units back and return the new stock."""
+        raise NotImplementedError
+
+
+class ShardedInventory(InventoryStore):
+    """In-process store: counts live in a compact array guarded by lock shards.
+
+    Purchases of different products rarely share a lock, so they do not
+    serialize behind each other.
+    """
+
+    def __init__(self, stock, shards=64):
+        self._slots = {product_id: slot for slot, product_id in enumerate(stock)}
+        self._counts = array("q", stock.values())
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _slot(self, product_id):
+        try:
+            return self._slots[product_id]
+        except KeyError:
+            raise UnknownProduct(product_id) from None
+
+    def get(self, product_id):
+        return self._counts[self._slot(product_id)]
+
+    def reserve(self, product_id, quantity=1):
+        slot = self._slot(product_id)
+        with self._locks[slot % len(self._locks)]:
+            if self._counts[slot] < quantity:
+                raise OutOfStock(product_id)
+            self._counts[slot] -= quantity
+            return self._counts[slot]
+
+    def reserve_many(self, quantities):
+        failures = {}
+        slots = {}
+        for product_id in quantities:
+            if product_id in self._slots:
+                slots[product_id] = self._slots[product_id]
+            else:
+                failures[product_id] = "not_found"
+
+        # Take every shard involved, always in the same order so that two
+        # batches can never wait on each other
+        shards = sorted({slot % len(self._locks) for slot in slots.values()})
+        with ExitStack() as stack:
+            for shard in shards:
+                stack.enter_context(self._locks[shard])
+            for product_id, slot in slots.items():
+                if self._counts[slot] < quantities[product_id]:
+                    failures[product_id] = "out_of_stock"
+            if failures:
+                raise BatchRejected(failures)
+            remaining = {}
+            for product_id, slot in slots.items():
+                self._counts[slot] -= quantities[product_id]
+                remaining[product_id] = self._counts[slot]
+            return remaining
+
+    def release(self, product_id, quantity=1):
+        slot = self._slot(product_id)
+        with self._locks[slot % len(self._locks)]:
+            self._counts[slot] += quantity
+            return self._counts[slot]
+
+
+class SQLiteInventory(InventoryStore):
+    """Store shared by every worker process through one SQLite file.
+
+    Each reservation is a single conditional UPDATE, so SQLite's write lock
+    makes the check and the decrement atomic across processes.
+    """
+
+    blocking = True
+
+    def __init__(self, path, stock):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inventory ("
+                "product_id INTEGER PRIMARY KEY, stock INTEGER NOT NULL CHECK (stock >= 0))"
+            )
+            # Seed without overwriting: other workers may already be selling.
+            conn.executemany(
+                "INSERT OR IGNORE INTO inventory (product_id, stock) VALUES (?, ?)",
+                stock.items(),
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, product_id):
+        row = self._connection().execute(
+            "SELECT stock FROM inventory WHERE product_id = ?", (product_id,)
+        ).fetchone()
+        if row is None:
+            raise UnknownProduct(product_id)
+        return row[0]
+
+    def get_many(self, product_ids):
+        product_ids = list(product_ids)
+        placeholders = ",".join("?" * len(product_ids))
+        rows = self._connection().execute(
+            f"SELECT product_id, stock FROM inventory WHERE product_id IN ({placeholders})",
+            product_ids,
+        )
+        return dict(rows.fetchall())
+
+    def reserve(self, product_id, quantity=1):
+        row = self._connection().execute(
+            "UPDATE inventory SET stock = stock - ? "
+            "WHERE product_id = ? AND stock >= ? RETURNING stock",
+            (quantity, product_id, quantity),
+        ).fetchone()
+        if row is None:
+            self.get(product_id)  # raises UnknownProduct for missing rows
+            raise OutOfStock(product_id)
+        return row[0]
+
+    def reserve_many(self, quantities):
+        conn = self._connection()
+        failures = {}
+        remaining = {}
+        # One write transaction: either every UPDATE commits or none does
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for product_id, quantity in quantities.items():
+                row = conn.execute(
+                    "UPDATE inventory SET stock = stock - ? "
+                    "WHERE product_id = ? AND stock >= ? RETURNING stock",
+                    (quantity, product_id, quantity),
+                ).fetchone()
+                if row is not None:
+                    remaining[product_id] = row[0]
+                elif conn.execute(
+                    "SELECT 1 FROM inventory WHERE product_id = ?", (product_id,)
+                ).fetchone():
+                    failures[product_id] = "out_of_stock"
+                else:
+                    failures[product_id] = "not_found"
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if failures:
+            conn.execute("ROLLBACK")
+            raise BatchRejected(failures)
+        conn.execute("COMMIT")
+        return remaining
+
+    def release(self, product_id, quantity=1):
+        row = self._connection().execute(
+            "UPDATE inventory SET stock = stock + ? WHERE product_id = ? RETURNING stock",
+            (quantity, product_id),
+        ).fetchone()
+        if row is None:
+            raise UnknownProduct(product_id)
+        return row[0]
+
+
+def create_inventory(stock, environ=os.environ):
+    backend = environ.get("INVENTORY_BACKEND", "memory").lower()
+    if backend == "memory":
+        return ShardedInventory(stock)
+    if backend == "sqlite":
+        return SQLiteInventory(environ.get("INVENTORY_DB", "/tmp/inventory.db"), stock)
+    raise ValueError(f"Unknown inventory backend '{backend}'")
@@ -1,13 +1,26 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest, multiprocess, CollectorRegistry
-import random
-import time
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess, CollectorRegistry
+from pydantic import BaseModel, Field
+from typing import Optional
+import os
 from datetime import datetime
 import logging
+import asyncio
+import time
 from contextlib import asynccontextmanager
-from .monitoring import setup_monitoring, REQUEST_COUNT, REQUEST_LATENCY, ERROR_COUNT
+from .monitoring import (
+    setup_monitoring, monitor_event_loop, monitor_process, MetricsMiddleware, TimedJSONResponse, TimedRoute,
+    TRACING, ERROR_COUNT, DEGRADED_COUNT, STAGES,
+)
+from .cache import create_cache
+from .catalog import load_catalog
+from .inventory import BatchRejected, OutOfStock, create_inventory
+from .profiling import ProfilerBusy, collapsed, create_profiler
+from .orchestration import DeadlineExceeded, DependencyCall, fan_out, load_orchestration_config
+from .simulation import create_shared_config, load_dependencies
 import json
 
 # Initialize logging
@@ -18,24 +31,40 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up...")
+    background = [asyncio.create_task(monitor_event_loop()), asyncio.create_task(monitor_process())]
+    if SIMULATION_SHARED is not None:
+        background.append(asyncio.create_task(SIMULATION_SHARED.watch()))
     yield
+    for task in background:
+        task.cancel()
     logger.info("Shutting down...")
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+# Per-stage timings: every route below records its handler time
+app.router.route_class = TimedRoute
 
 # Get tracer
 tracer = setup_monitoring(app)
 
-# Initialize the Prometheus registry
-registry = CollectorRegistry()
+def metrics_registry():
+    # Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR;
+    # collect them all so a scrape reports totals for the whole server.
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
 
 @app.get("/metrics")
 async def metrics():
     return Response(
-        generate_latest(),  # Remove registry parameter as it's not needed
+        generate_latest(metrics_registry()),
         media_type=CONTENT_TYPE_LATEST
     )
 
+# Request count and latency for every route
+app.add_middleware(MetricsMiddleware, excluded_paths=("/metrics", "/debug/profile"))
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -45,72 +74,192 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Sample data
-PRODUCTS = {
-    1: {"name": "Laptop", "price": 999.99, "stock": 10, "id": 1 },
-    2: {"name": "Smartphone", "price": 499.99, "stock": 20, "id": 2},
-    3: {"name": "Headphones", "price": 99.99, "stock": 100, "id": 3},
-}
+# Simulated downstream dependencies (latency, errors and timeouts)
+DEPENDENCIES = load_dependencies()
+# Under gunicorn, changes made through /config/simulation reach every worker
+SIMULATION_SHARED = create_shared_config(DEPENDENCIES)
+# PUT /config/simulation changes server behaviour, so it is off unless asked for
+SIMULATION_CONFIG_ENABLED = os.environ.get("SIMULATION_CONFIG_ENABLED", "false").lower() in ("1", "true", "yes")
+ORCHESTRATION = load_orchestration_config()
+
+# Sample data, replaced by the file at CATALOG_PATH when set
+SAMPLE_PRODUCTS = [
+    {"name": "Laptop", "price": 999.99, "stock": 10, "id": 1 },
+    {"name": "Smartphone", "price": 499.99, "stock": 20, "id": 2},
+    {"name": "Headphones", "price": 99.99, "stock": 100, "id": 3},
+]
+
+CATALOG = load_catalog(SAMPLE_PRODUCTS)
+PRODUCTS = CATALOG.products
+
+# Live stock counts; the "stock" values above only seed the store
+INVENTORY = create_inventory({product_id: p.get("stock", 0) for product_id, p in PRODUCTS.items()})
+
+# Product records served by get_product
+PRODUCT_CACHE = create_cache("product")
+
+# Upper bound on ids per bulk fetch and items per batch purchase
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "100"))
+
+async def inventory_call(method, *args):
+    if INVENTORY.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+# Sampling profiler behind /debug/profile, None unless PROFILING_ENABLED is set
+PROFILER = create_profiler()
 
 @app.get("/")
 async def read_root():
     with tracer.start_as_current_span("root_request") as span:
-        REQUEST_COUNT.labels(endpoint="/", status="success").inc()
         return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
-@app.get("/products/{product_id}")
-async def get_product(product_id: int):
-    with tracer.start_as_current_span("get_product") as span:
-        start_time = time.time()
+@app.get("/ready")
+async def readiness():
+    # The API is ready as soon as it serves; tracing is reported on its own
+    # because the app keeps working (without traces) while Tempo is down
+    return {"status": "ready", "tracing": TRACING.status}
+
+def parse_ids(ids):
+    try:
+        # Keep the caller's order but drop repeats
+        product_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be comma-separated integers")
+    if not product_ids:
+        raise HTTPException(status_code=422, detail="ids must not be empty")
+    if len(product_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_SIZE} ids per request")
+    return product_ids
+
+@app.get("/products")
+async def get_products(ids: str, response: Response):
+    with tracer.start_as_current_span("get_products") as span:
         try:
-            # Add more detailed span attributes
-            span.set_attribute("product.id", product_id)
-            span.set_attribute("request.type", "get_product")
+            product_ids = parse_ids(ids)
+            if span.is_recording():
+                span.set_attribute("request.type", "get_products")
+                span.set_attribute("batch.size", len(product_ids))
+
+            products = await PRODUCT_CACHE.lookup_many(product_ids)
+            misses = [product_id for product_id in product_ids if product_id not in products]
 
-            # Simulate database query latency
-            simulate_db_query(span)
+            if misses:
+                # One database round trip and one recommendation call for
+                # every miss in the batch, instead of one pair per product
+                await call_dependencies(span, response)
+                for product_id in misses:
+                    if product_id in PRODUCTS:
+                        products[product_id] = PRODUCTS[product_id]
+                        await PRODUCT_CACHE.store(product_id, PRODUCTS[product_id])
+
+            stock = await inventory_call(INVENTORY.get_many, list(products))
+            missing = [product_id for product_id in product_ids if product_id not in products]
+            if missing:
+                ERROR_COUNT.labels(error_type="not_found").inc(len(missing))
+            if span.is_recording():
+                span.set_attribute("batch.cache_misses", len(misses))
+                span.set_attribute("batch.not_found", len(missing))
+            return {
+                "products": [
+                    {**products[product_id], "stock": stock[product_id]}
+                    for product_id in product_ids if product_id in products
+                ],
+                "missing": missing,
+            }
+
+        except Exception as e:
+            span.set_attribute("error", True)
+            span.set_attribute("error.message", str(e))
+            logger.error(f"Error fetching products {ids}: {str(e)}")
+            raise
 
-            # Simulate external service call (e.g., recommendation engine)
-            simulate_external_service(span)
+@app.get("/products/search")
+async def search_products(
+    query: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    with tracer.start_as_current_span("search_products") as span:
+        try:
+            # Simulate the database query and recommendation engine call
+            await call_dependencies(span, response)
             
-            if product_id not in PRODUCTS:
-                span.set_attribute("error", True)
-                span.set_attribute("error.type", "not_found")
-                ERROR_COUNT.labels(error_type="not_found").inc()
-                raise HTTPException(status_code=404, detail="Product not found")
+            # Look up matches in the catalog index, one page at a time
+            results = CATALOG.search(query, limit=limit, offset=offset)
+            stock = await inventory_call(INVENTORY.get_many, [product["id"] for product in results])
+            results = [{**product, "stock": stock[product["id"]]} for product in results]
             
-            # Add product details to span
-            product = PRODUCTS[product_id]
-            span.set_attribute("product.name", product["name"])
-            span.set_attribute("product.price", product["price"])
-            span.set_attribute("product.stock", product["stock"])
-            span.set_attribute("status", "success")
-            span.set_attribute("response.type", "product")
-            span.set_attribute("response.status", 200)
-            span.set_attribute("endpoint", "/products")
+            if span.is_recording():
+                span.set_attribute("search.query", query)
+                span.set_attribute("search.results_count", len(results))
+            return results
+            
+        except Exception as e:
+            span.set_attribute("error", True)
+            span.set_attribute("error.message", str(e))
+            ERROR_COUNT.labels(error_type="search_error").inc()
+            raise
 
+@app.get("/products/{product_id}")
+async def get_product(product_id: int, response: Response):
+    with tracer.start_as_current_span("get_product") as span:
+        try:
+            # Add more detailed span attributes (skipped for unsampled spans)
+            recording = span.is_recording()
+            if recording:
+                span.set_attribute("product.id", product_id)
+                span.set_attribute("request.type", "get_product")
+
+            # Only a cache miss pays for the simulated database query and
+            # recommendation engine call
+            product = await PRODUCT_CACHE.get_or_load(
+                product_id, lambda: load_product(product_id, span, response)
+            )
+            # Stock is always read live, so a cached record never shows a stale
+            # count even if another worker sold the last unit. Build a new dict:
+            # the loaded record is the shared catalog entry, also handed to
+            # every coalesced waiter
+            product = {**product, "stock": await inventory_call(INVENTORY.get, product_id)}
+            
+            # Add product details to span
+            if recording:
+                span.set_attribute("product.name", product["name"])
+                span.set_attribute("product.price", product["price"])
+                span.set_attribute("product.stock", product["stock"])
+                span.set_attribute("status", "success")
+                span.set_attribute("response.type", "product")
+                span.set_attribute("response.status", 200)
+                span.set_attribute("endpoint", "/products/{product_id}")
             
-            REQUEST_COUNT.labels(endpoint="/products", status="success").inc()
             return product
             
         except Exception as e:
             span.set_attribute("error", True)
             span.set_attribute("error.message", str(e))
-            REQUEST_COUNT.labels(endpoint="/products", status="error").inc()
             logger.error(f"Error fetching product {product_id}: {str(e)}")
             raise
-        finally:
-            REQUEST_LATENCY.labels(endpoint="/products").observe(
-                time.time() - start_time
-            )
+
+async def load_product(product_id, span, response):
+    # Simulate the database query and recommendation engine call
+    await call_dependencies(span, response)
+
+    if product_id not in PRODUCTS:
+        span.set_attribute("error", True)
+        span.set_attribute("error.type", "not_found")
+        ERROR_COUNT.labels(error_type="not_found").inc()
+        raise HTTPException(status_code=404, detail="Product not found")
+    return PRODUCTS[product_id]
 
 @app.post("/products/{product_id}/purchase")
 async def purchase_product(product_id: int):
     with tracer.start_as_current_span("purchase_product") as span:
-        start_time = time.time()
         try:
-            span.set_attribute("product.id", product_id)
-            span.set_attribute("request.type", "purchase_product")
+            recording = span.is_recording()
+            if recording:
+                span.set_attribute("product.id", product_id)
+                span.set_attribute("request.type", "purchase_product")
             
             if product_id not in PRODUCTS:
                 span.set_attribute("error", True)
@@ -119,80 +268,201 @@ async def purchase_product(product_id: int):
                 raise HTTPException(status_code=404, detail="Product not found")
             
             product = PRODUCTS[product_id]
-            if product["stock"] <= 0:
+            try:
+                # Check and decrement in one atomic step
+                remaining_stock = await inventory_call(INVENTORY.reserve, product_id)
+            except OutOfStock:
                 span.set_attribute("error", True)
                 span.set_attribute("error.type", "out_of_stock")
                 ERROR_COUNT.labels(error_type="out_of_stock").inc()
                 raise HTTPException(status_code=400, detail="Product out of stock")
             
-            # Simulate purchase by reducing stock
-            PRODUCTS[product_id]["stock"] -= 1
+            await PRODUCT_CACHE.invalidate(product_id)
             
-            span.set_attribute("product.name", product["name"])
-            span.set_attribute("product.remaining_stock", product["stock"])
-            span.set_attribute("status", "success")
-            span.set_attribute("endpoint", "/purchase")
+            if recording:
+                span.set_attribute("product.name", product["name"])
+                span.set_attribute("product.remaining_stock", remaining_stock)
+                span.set_attribute("status", "success")
+                span.set_attribute("endpoint", "/products/{product_id}/purchase")
             
-            REQUEST_COUNT.labels(endpoint="/purchase", status="success").inc()
-            return {"message": "Purchase successful", "remaining_stock": product["stock"]}
+            return {"message": "Purchase successful", "remaining_stock": remaining_stock}
             
         except Exception as e:
             span.set_attribute("error", True)
             span.set_attribute("error.message", str(e))
-            REQUEST_COUNT.labels(endpoint="/purchase", status="error").inc()
             logger.error(f"Error processing purchase for product {product_id}: {str(e)}")
             raise
-        finally:
-            REQUEST_LATENCY.labels(endpoint="/purchase").observe(
-                time.time() - start_time
-            )
-@app.get("/products/search")
-async def search_products(query: str):
-    with tracer.start_as_current_span("search_products") as span:
-        start_time = time.time()
+
+# Out-of-range values are rejected with a 422 here; SQLite integers are
+# signed 64-bit and would otherwise overflow into a 500
+MAX_PRODUCT_ID = 2**63 - 1
+MAX_QUANTITY = 1_000_000
+
+class PurchaseItem(BaseModel):
+    product_id: int = Field(ge=1, le=MAX_PRODUCT_ID)
+    quantity: int = Field(1, ge=1, le=MAX_QUANTITY)
+
+class PurchaseBatch(BaseModel):
+    items: list[PurchaseItem] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+@app.post("/purchases")
+async def purchase_products(order: PurchaseBatch, response: Response):
+    with tracer.start_as_current_span("purchase_products") as span:
         try:
-            # Simulate database query latency
-            simulate_db_query(span)
-            
-            # Simulate external service call (e.g., recommendation engine)
-            simulate_external_service(span)
-            
-            # Filter products (simple mock implementation)
-            results = [
-                product for product in PRODUCTS.values() 
-                if query.lower() in product["name"].lower()
-            ]
-            
-            span.set_attribute("search.query", query)
-            span.set_attribute("search.results_count", len(results))
-            REQUEST_COUNT.labels(endpoint="/products/search", status="success").inc()
-            return results
-            
+            # Repeated lines for one product are bought together
+            quantities = {}
+            for item in order.items:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            if span.is_recording():
+                span.set_attribute("request.type", "purchase_products")
+                span.set_attribute("batch.size", len(quantities))
+
+            try:
+                # Every decrement is applied or none is
+                remaining = await inventory_call(INVENTORY.reserve_many, quantities)
+            except BatchRejected as e:
+                span.set_attribute("error", True)
+                span.set_attribute("error.type", "batch_rejected")
+                for reason in e.failures.values():
+                    ERROR_COUNT.labels(error_type=reason).inc()
+                response.status_code = 409
+                return {
+                    "message": "Purchase rejected, no stock was reserved",
+                    "items": [
+                        {
+                            "product_id": product_id,
+                            "quantity": quantity,
+                            "status": e.failures.get(product_id, "not_reserved"),
+                        }
+                        for product_id, quantity in quantities.items()
+                    ],
+                }
+
+            for product_id in quantities:
+                await PRODUCT_CACHE.invalidate(product_id)
+
+            if span.is_recording():
+                span.set_attribute("status", "success")
+                span.set_attribute("endpoint", "/purchases")
+            return {
+                "message": "Purchase successful",
+                "items": [
+                    {
+                        "product_id": product_id,
+                        "quantity": quantity,
+                        "status": "reserved",
+                        "remaining_stock": remaining[product_id],
+                    }
+                    for product_id, quantity in quantities.items()
+                ],
+            }
+
         except Exception as e:
             span.set_attribute("error", True)
             span.set_attribute("error.message", str(e))
-            ERROR_COUNT.labels(error_type="search_error").inc()
+            logger.error(f"Error processing batch purchase: {str(e)}")
             raise
-        finally:
-            REQUEST_LATENCY.labels(endpoint="/products/search").observe(
-                time.time() - start_time
-            )
 
-def simulate_db_query(span):    
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = Query(10, gt=0)):
+    if PROFILER is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ENABLED=true)")
+    if seconds > PROFILER.max_seconds:
+        raise HTTPException(status_code=422, detail=f"seconds must be at most {PROFILER.max_seconds:g}")
+    try:
+        # The sampler sleeps between samples, so it gets its own thread
+        # rather than holding the event loop
+        stacks, samples, busy = await asyncio.to_thread(PROFILER.profile, seconds)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return Response(
+        collapsed(stacks),
+        media_type="text/plain",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{int(time.time())}.folded"',
+            "X-Profile-Samples": str(samples),
+            # Share of the profiled time the sampler itself was running
+            "X-Profile-Overhead": f"{busy / seconds:.4f}",
+        },
+    )
+
+class DependencyUpdate(BaseModel):
+    latency: Optional[str] = None
+    error_rate: Optional[float] = None
+    timeout: Optional[float] = None
+
+@app.get("/config/simulation")
+async def get_simulation_config():
+    if SIMULATION_SHARED is not None:
+        SIMULATION_SHARED.sync()
+    return {name: dependency.to_dict() for name, dependency in DEPENDENCIES.items()}
+
+@app.put("/config/simulation/{dependency}")
+async def update_simulation_config(dependency: str, update: DependencyUpdate):
+    if not SIMULATION_CONFIG_ENABLED:
+        raise HTTPException(status_code=404, detail="Runtime simulation config is disabled (set SIMULATION_CONFIG_ENABLED=true)")
+    if dependency not in DEPENDENCIES:
+        raise HTTPException(status_code=404, detail="Unknown dependency")
+    try:
+        if SIMULATION_SHARED is not None:
+            # Start from the latest shared settings so this update does not
+            # undo one made through another worker
+            SIMULATION_SHARED.sync()
+        # Replay files named through the API must come from SIM_REPLAY_DIR
+        DEPENDENCIES[dependency].configure(**update.model_dump(), trusted=False)
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if SIMULATION_SHARED is not None:
+        SIMULATION_SHARED.publish()
+    logger.info(f"Updated simulation for {dependency}: {DEPENDENCIES[dependency].to_dict()}")
+    return DEPENDENCIES[dependency].to_dict()
+
+async def call_dependencies(span, response):
+    # The DB lookup is required; recommendations are best-effort and are
+    # dropped if they fail or miss their budget.
+    try:
+        outcome = await fan_out(
+            [
+                DependencyCall("db", lambda: simulate_db_query(span)),
+                DependencyCall(
+                    "recommendation",
+                    lambda: simulate_external_service(span),
+                    required=False,
+                    budget=ORCHESTRATION.recommendation_budget,
+                    hedge_after=ORCHESTRATION.recommendation_hedge_after,
+                ),
+            ],
+            deadline=ORCHESTRATION.deadline,
+            mode=ORCHESTRATION.mode,
+        )
+    except DeadlineExceeded as e:
+        span.set_attribute("error.type", "deadline_exceeded")
+        ERROR_COUNT.labels(error_type="deadline_exceeded").inc()
+        raise HTTPException(status_code=504, detail=str(e))
+
+    if outcome.degraded:
+        degraded = ",".join(outcome.degraded)
+        span.set_attribute("degraded", degraded)
+        response.headers["X-Degraded-Dependencies"] = degraded
+        for name in outcome.degraded:
+            DEGRADED_COUNT.labels(dependency=name).inc()
+    return outcome
+
+async def simulate_db_query(span):
     with tracer.start_span("db_query") as db_span:
-        # Set db_span to child of parent span        
-        # Simulate variable database query time
-        delay = random.uniform(0.2, 1.55)
-        time.sleep(delay)
+        start = time.perf_counter_ns()
+        try:
+            delay = await DEPENDENCIES["db"].call()
+        finally:
+            STAGES["db"].observe((time.perf_counter_ns() - start) / 1e9)
         db_span.set_attribute("db.query_time", delay)
-        if random.random() < 0.01:  # 1% chance of db error
-            raise Exception("Database connection timeout")
 
-def simulate_external_service(span):
+async def simulate_external_service(span):
     with tracer.start_span("recommendation_service") as service_span:
         # Simulate external API call
-        delay = random.uniform(0.05, 1.25)
-        time.sleep(delay)
+        start = time.perf_counter_ns()
+        try:
+            delay = await DEPENDENCIES["recommendation"].call()
+        finally:
+            STAGES["external"].observe((time.perf_counter_ns() - start) / 1e9)
         service_span.set_attribute("service.response_time", delay)
-        if random.random() < 0.01:  # 1% chance of service error
-            raise Exception("External service unavailable")
\ No newline at end of file
@@ -1,14 +1,24 @@
 from opentelemetry import trace
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.sdk.resources import Resource  # Add this
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
 from opentelemetry.semconv.resource import ResourceAttributes  # Add this
 
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.process_collector import ProcessCollector
+import asyncio
+import collections
 import os
+import random
+import threading
 import time
+import urllib.parse
 import requests
 from requests.exceptions import RequestException
 import logging
@@ -24,10 +34,16 @@ REQUEST_COUNT = Counter(
     ["endpoint", "status"]
 )
 
+# Bucket edges around our latency objectives: cache hits and health checks
+# land in the low buckets, the dependency fan-out between 0.25s and the 3s
+# request deadline
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
 REQUEST_LATENCY = Histogram(
     "app_request_latency_seconds",
     "Request latency by endpoint",
-    ["endpoint"]
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
 )
 
 ERROR_COUNT = Counter(
@@ -36,10 +52,70 @@ ERROR_COUNT = Counter(
     ["error_type"]
 )
 
-def wait_for_tempo(tempo_host="tempo", tempo_port="3200", max_retries=5, retry_delay=2):
+DEGRADED_COUNT = Counter(
+    "app_degraded_response_total",
+    "Responses served without an optional dependency",
+    ["dependency"]
+)
+
+CACHE_HITS = Counter(
+    "app_cache_hits_total",
+    "Cache lookups served from the cache",
+    ["cache"]
+)
+
+CACHE_MISSES = Counter(
+    "app_cache_misses_total",
+    "Cache lookups that had to load the value",
+    ["cache"]
+)
+
+CACHE_COALESCED = Counter(
+    "app_cache_coalesced_total",
+    "Cache misses that waited on a load already in flight",
+    ["cache"]
+)
+
+CACHE_EVICTIONS = Counter(
+    "app_cache_evictions_total",
+    "Entries evicted to stay within the cache bounds",
+    ["cache"]
+)
+
+SPANS_DROPPED = Counter(
+    "app_spans_dropped_total",
+    "Spans discarded before reaching the exporter",
+    ["reason"]
+)
+
+# Serialization takes well under a millisecond, so the stage buckets start
+# lower than the request ones
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025) + LATENCY_BUCKETS
+
+STAGE_LATENCY = Histogram(
+    "app_stage_latency_seconds",
+    "Time spent in each stage of handling a request",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+# Bound once, observed on every request
+STAGES = {
+    stage: STAGE_LATENCY.labels(stage=stage)
+    for stage in ("db", "external", "serialization", "handler")
+}
+
+# Workers each run their own loop; report the worst live one
+EVENT_LOOP_LAG = Gauge(
+    "app_event_loop_lag_seconds",
+    "How late the event loop woke up from its last timed sleep",
+    multiprocess_mode="livemax"
+)
+
+def wait_for_tempo(tempo_host="tempo", tempo_port="3200", max_retries=5, retry_delay=2, timeout=1):
     for i in range(max_retries):
         try:
-            response = requests.get(f"http://{tempo_host}:{tempo_port}/ready")
+            response = requests.get(f"http://{tempo_host}:{tempo_port}/ready", timeout=timeout)
             if response.status_code == 200:
                 return True
         except RequestException:
@@ -47,25 +123,346 @@ def wait_for_tempo(tempo_host="tempo", tempo_port="3200", max_retries=5, retry_d
         time.sleep(retry_delay)
     return False
 
-def setup_monitoring(app):
-    # Wait for Tempo to be ready
-    if not wait_for_tempo():
-        logger.warning("Tempo not available, but continuing anyway...")
+class TracingState:
+    CONNECTING = "connecting"
+    READY = "ready"
+    UNAVAILABLE = "unavailable"
+
+    def __init__(self):
+        self.status = self.CONNECTING
+
+TRACING = TracingState()
+
+class GatedSpanProcessor(SpanProcessor):
+    """Holds spans back while the first Tempo readiness check runs.
+
+    The real processor is only built by ``open()``, after that check has
+    either passed or given up. Until then finished spans wait in a bounded
+    buffer, so tracing never slows requests down or grows memory at startup.
+    """
+
+    def __init__(self, processor_factory, max_buffered=2048):
+        self._factory = processor_factory
+        self._buffer = collections.deque()
+        self._max_buffered = max_buffered
+        self._processor = None
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        if self._processor is not None:
+            self._processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        if self._processor is not None:
+            self._processor.on_end(span)
+            return
+        with self._lock:
+            if self._processor is not None:
+                self._processor.on_end(span)
+            elif len(self._buffer) >= self._max_buffered:
+                SPANS_DROPPED.labels(reason="startup_buffer_full").inc()
+            else:
+                self._buffer.append(span)
+
+    def open(self):
+        with self._lock:
+            self._processor = self._factory()
+            while self._buffer:
+                self._processor.on_end(self._buffer.popleft())
+
+    def shutdown(self):
+        if self._processor is not None:
+            self._processor.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        if self._processor is not None:
+            return self._processor.force_flush(timeout_millis)
+        return True
+
+class CountingSpanExporter(SpanExporter):
+    """Wraps an exporter to count the spans of every failed export."""
+
+    def __init__(self, exporter):
+        self._exporter = exporter
+
+    def export(self, spans):
+        try:
+            result = self._exporter.export(spans)
+        except Exception:
+            SPANS_DROPPED.labels(reason="export_failed").inc(len(spans))
+            raise
+        if result is not SpanExportResult.SUCCESS:
+            SPANS_DROPPED.labels(reason="export_failed").inc(len(spans))
+        return result
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._exporter.force_flush(timeout_millis)
+
+class CountingBatchSpanProcessor(BatchSpanProcessor):
+    """BatchSpanProcessor that counts the spans it drops.
 
+    When its queue is full the SDK evicts the oldest span and only logs a
+    warning, so the queue is checked here before handing the span over (a
+    span can be miscounted if the export thread drains the queue meanwhile).
+    """
+
+    def __init__(self, span_exporter, **kwargs):
+        super().__init__(CountingSpanExporter(span_exporter), **kwargs)
+
+    def on_end(self, span):
+        batch = self._batch_processor
+        if span.context.trace_flags.sampled and len(batch._queue) >= batch._max_queue_size:
+            SPANS_DROPPED.labels(reason="export_queue_full").inc()
+        super().on_end(span)
+
+class TailSamplingProcessor(SpanProcessor):
+    """Decides whether to export a trace once its local root span has ended.
+
+    Traces containing an error (the ``error`` attribute the handlers set, or
+    an ERROR status) and traces slower than ``latency_threshold`` seconds are
+    always kept; the rest are kept with probability ``keep_ratio``. At most
+    ``max_traces`` unfinished traces are held; beyond that the oldest are
+    dropped.
+    """
+
+    def __init__(self, processor, keep_ratio=0.1, latency_threshold=1.0, max_traces=10000):
+        self._processor = processor
+        self._keep_ratio = keep_ratio
+        self._threshold_ns = int(latency_threshold * 1e9)
+        self._max_traces = max_traces
+        self._pending = collections.OrderedDict()
+        # Recent decisions, for spans that end after their root (e.g. a
+        # cancelled background call)
+        self._decided = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        self._processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            if trace_id in self._decided:
+                spans, keep = [span], self._decided[trace_id]
+            elif not is_root:
+                self._pending.setdefault(trace_id, []).append(span)
+                while len(self._pending) > self._max_traces:
+                    _, evicted = self._pending.popitem(last=False)
+                    SPANS_DROPPED.labels(reason="tail_buffer_full").inc(len(evicted))
+                return
+            else:
+                spans = self._pending.pop(trace_id, [])
+                spans.append(span)
+                keep = self._keep(spans, span)
+                self._decided[trace_id] = keep
+                if len(self._decided) > self._max_traces:
+                    self._decided.popitem(last=False)
+        if keep:
+            for finished in spans:
+                self._processor.on_end(finished)
+        else:
+            SPANS_DROPPED.labels(reason="tail_sampled").inc(len(spans))
+
+    def _keep(self, spans, root):
+        for span in spans:
+            if span.attributes.get("error") is True or span.status.status_code is StatusCode.ERROR:
+                return True
+        if root.end_time - root.start_time >= self._threshold_ns:
+            return True
+        return random.random() < self._keep_ratio
+
+    def shutdown(self):
+        self._processor.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._processor.force_flush(timeout_millis)
+
+def connect_tracing(gate, state, tempo_host, tempo_port, max_backoff=30):
+    # Runs in a background thread. Exporting starts after the first round of
+    # checks whatever its outcome: the OTLP endpoint may be a collector, or
+    # Tempo's /ready port may simply not be reachable from here. The exporter
+    # retries on its own and failed exports show up in app_spans_dropped_total.
+    ready = wait_for_tempo(tempo_host, tempo_port)
+    gate.open()
+    if ready:
+        state.status = TracingState.READY
+        logger.info("Tempo is ready, exporting traces")
+        return
+    logger.warning("Tempo readiness check failed, exporting traces anyway")
+    state.status = TracingState.UNAVAILABLE
+    # Keep polling so /ready reports when Tempo comes up
+    delay = 2
+    while not wait_for_tempo(tempo_host, tempo_port):
+        time.sleep(delay)
+        delay = min(delay * 2, max_backoff)
+    state.status = TracingState.READY
+    logger.info("Tempo is ready")
+
+def endpoint_host(endpoint):
+    # TEMPO_ENDPOINT may be "tempo:4317" or a URL such as "http://tempo:4317"
+    parsed = urllib.parse.urlsplit(endpoint if "://" in endpoint else f"//{endpoint}")
+    return parsed.hostname or "tempo"
+
+class MetricsMiddleware:
+    """ASGI middleware recording REQUEST_COUNT and REQUEST_LATENCY for every route.
+
+    Requests are labelled with the route template (``/products/{product_id}``)
+    rather than the raw path. Metric children are bound once per
+    (route, status) and reused, so the per-request cost is two dict lookups
+    and the observations themselves.
+    """
+
+    def __init__(self, app, excluded_paths=("/metrics",)):
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+        self._counters = {}
+        self._histograms = {}
+
+    def _children(self, endpoint, status):
+        key = (endpoint, status)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = REQUEST_COUNT.labels(endpoint=endpoint, status=status)
+        histogram = self._histograms.get(endpoint)
+        if histogram is None:
+            histogram = self._histograms[endpoint] = REQUEST_LATENCY.labels(endpoint=endpoint)
+        return counter, histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter_ns()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = (time.perf_counter_ns() - start) / 1e9
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label so they cannot blow up cardinality
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            counter, histogram = self._children(endpoint, "success" if status_code < 400 else "error")
+            counter.inc()
+            histogram.observe(elapsed)
+
+class TimedRoute(APIRoute):
+    """Records the ``handler`` stage: validation, the endpoint and rendering.
+
+    Whatever REQUEST_LATENCY adds on top of it is spent in the middleware
+    stack (metrics, CORS, tracing).
+    """
+
+    untimed_paths = {"/metrics", "/debug/profile"}
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if self.path in self.untimed_paths:
+            return handler
+
+        async def timed_handler(request):
+            start = time.perf_counter_ns()
+            try:
+                return await handler(request)
+            finally:
+                STAGES["handler"].observe((time.perf_counter_ns() - start) / 1e9)
+
+        return timed_handler
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records how long rendering the body took."""
+
+    def render(self, content):
+        start = time.perf_counter_ns()
+        try:
+            return super().render(content)
+        finally:
+            STAGES["serialization"].observe((time.perf_counter_ns() - start) / 1e9)
+
+# The default process_* metrics describe only the process that answers the
+# scrape and are not exported at all in multiprocess mode, so every worker
+# publishes its own (one series per pid)
+PROCESS_METRICS = {
+    "process_resident_memory_bytes": Gauge(
+        "app_process_resident_memory_bytes",
+        "Resident memory of each worker process",
+        multiprocess_mode="liveall"
+    ),
+    "process_cpu_seconds_total": Gauge(
+        "app_process_cpu_seconds",
+        "CPU time used by each worker process",
+        multiprocess_mode="liveall"
+    ),
+    "process_open_fds": Gauge(
+        "app_process_open_fds",
+        "Open file descriptors of each worker process",
+        multiprocess_mode="liveall"
+    ),
+}
+
+async def monitor_process(interval=5.0):
+    collector = ProcessCollector(registry=None)
+    while True:
+        for family in collector.collect():
+            for sample in family.samples:
+                gauge = PROCESS_METRICS.get(sample.name)
+                if gauge is not None:
+                    gauge.set(sample.value)
+        await asyncio.sleep(interval)
+
+async def monitor_event_loop(interval=0.25):
+    # A callback that is due now runs only once everything ahead of it in the
+    # loop has yielded, so oversleeping measures how long requests wait for
+    # the loop
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(loop.time() - start - interval, 0.0))
+
+def setup_monitoring(app):
     # Create a Resource to identify your service
     resource = Resource.create({
         ResourceAttributes.SERVICE_NAME: "product-api",  # This will be the service name in Tempo
         ResourceAttributes.DEPLOYMENT_ENVIRONMENT: "development"
     })
 
-    # Set up OpenTelemetry tracer
-    tracer_provider = TracerProvider(resource=resource)
-    otlp_exporter = OTLPSpanExporter(
-        endpoint=os.getenv("TEMPO_ENDPOINT", "tempo:4317"),
-        insecure=True
+    # Set up OpenTelemetry tracer. Head sampling decides up front which
+    # traces are recorded at all; unsampled spans skip attribute and export work
+    sampler = ParentBased(TraceIdRatioBased(float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))))
+    tracer_provider = TracerProvider(resource=resource, sampler=sampler)
+    tempo_endpoint = os.getenv("TEMPO_ENDPOINT", "tempo:4317")
+    span_processor = GatedSpanProcessor(
+        lambda: CountingBatchSpanProcessor(OTLPSpanExporter(endpoint=tempo_endpoint, insecure=True))
     )
-    span_processor = BatchSpanProcessor(otlp_exporter)
-    tracer_provider.add_span_processor(span_processor)
+    if os.getenv("TRACE_TAIL_SAMPLING", "false").lower() in ("1", "true", "yes"):
+        tracer_provider.add_span_processor(TailSamplingProcessor(
+            span_processor,
+            keep_ratio=float(os.getenv("TRACE_TAIL_SAMPLE_RATIO", "0.1")),
+            latency_threshold=float(os.getenv("TRACE_TAIL_LATENCY_THRESHOLD", "1.0")),
+            max_traces=int(os.getenv("TRACE_TAIL_MAX_TRACES", "10000")),
+        ))
+    else:
+        tracer_provider.add_span_processor(span_processor)
+
+    # Check Tempo in the background so the app starts serving right away
+    threading.Thread(
+        target=connect_tracing,
+        args=(span_processor, TRACING, endpoint_host(tempo_endpoint), os.getenv("TEMPO_READY_PORT", "3200")),
+        name="tempo-readiness",
+        daemon=True,
+    ).start()
     
     # Set the tracer provider
     trace.set_tracer_provider(tracer_provider)
@@ -0,0 +1,132 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@dataclass
+class DependencyCall:
+    name: str
+    call: Callable[[], Awaitable[Any]]
+    # Optional dependencies are dropped (the request degrades) when they fail
+    # or miss their budget; required ones fail the whole request.
+    required: bool = True
+    budget: Optional[float] = None
+    # Issue a second, hedged attempt if the first has not answered by then.
+    hedge_after: Optional[float] = None
+
+
+@dataclass
+class FanOutResult:
+    results: dict = field(default_factory=dict)
+    degraded: list = field(default_factory=list)
+
+
+@dataclass
+class OrchestrationConfig:
+    mode: str = "concurrent"
+    deadline: float = 3.0
+    recommendation_budget: Optional[float] = 1.0
+    recommendation_hedge_after: Optional[float] = None
+
+
+def _optional_float(value):
+    if value is None or value == "":
+        return None
+    return float(value) or None
+
+
+def load_orchestration_config(environ=os.environ):
+    config = OrchestrationConfig()
+    config.mode = environ.get("ORCHESTRATION_MODE", config.mode).lower()
+    if config.mode not in ("concurrent", "sequential"):
+        raise ValueError(f"Unknown orchestration mode '{config.mode}'")
+    config.deadline = float(environ.get("REQUEST_DEADLINE", config.deadline))
+    if "RECOMMENDATION_BUDGET" in environ:
+        config.recommendation_budget = _optional_float(environ["RECOMMENDATION_BUDGET"])
+    if "RECOMMENDATION_HEDGE_AFTER" in environ:
+        config.recommendation_hedge_after = _optional_float(environ["RECOMMENDATION_HEDGE_AFTER"])
+    return config
+
+
+async def _hedged(call, hedge_after):
+    # Every attempt is cancelled on the way out, including when the caller is
+    # cancelled while the first one is still running
+    attempts = {asyncio.ensure_future(call())}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+        if not done:
+            attempts.add(asyncio.ensure_future(call()))
+        error = None
+        while attempts:
+            done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+
+async def _run(dependency, remaining):
+    limit = remaining
+    if dependency.budget is not None:
+        limit = min(limit, dependency.budget)
+    if dependency.hedge_after is not None and dependency.hedge_after < limit:
+        coro = _hedged(dependency.call, dependency.hedge_after)
+    else:
+        coro = dependency.call()
+    try:
+        return await asyncio.wait_for(coro, timeout=max(limit, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{dependency.name} exceeded its {limit:.3f}s budget")
+
+
+async def _settle(dependency, remaining, outcome):
+    try:
+        outcome.results[dependency.name] = await _run(dependency, remaining)
+    except Exception:
+        if dependency.required:
+            raise
+        outcome.degraded.append(dependency.name)
+
+
+async def fan_out(dependencies, deadline, mode="concurrent"):
+    """Call the downstream dependencies under a single request deadline.
+
+    In concurrent mode independent calls run side by side, so request latency
+    follows the slowest required dependency instead of the sum of all of them.
+    """
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+    outcome = FanOutResult()
+
+    if mode == "sequential":
+        for dependency in dependencies:
+            await _settle(dependency, expires_at - loop.time(), outcome)
+        return outcome
+
+    tasks = [
+        asyncio.ensure_future(_settle(dependency, deadline, outcome))
+        for dependency in dependencies
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # Whether a call failed or the request itself was cancelled, stop the
+        # remaining calls and let them unwind (and close their spans) first.
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
+    return outcome
@@ -0,0 +1,91 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Samples the stack of every thread at a fixed interval.
+
+    Nothing is installed in the interpreter: a background thread reads
+    ``sys._current_frames()`` ``1 / interval`` times a second, so the cost is
+    bounded by the sampling rate whatever the request load. Only one profile
+    runs at a time and each one is capped at ``max_seconds``.
+    """
+
+    def __init__(self, interval=0.01, max_seconds=60, max_depth=128):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self._running = threading.Lock()
+
+    def profile(self, seconds):
+        """Sample for ``seconds`` and return (stacks, samples, busy seconds).
+
+        ``stacks`` is a Counter of collapsed stacks, root first, prefixed with
+        the thread name. Raises ProfilerBusy if another profile is running.
+        """
+        if not self._running.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            return self._sample(min(seconds, self.max_seconds))
+        finally:
+            self._running.release()
+
+    def _sample(self, seconds):
+        stacks = collections.Counter()
+        labels = {}
+        samples = 0
+        busy = 0.0
+        me = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}").replace(" ", "_"))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            time.sleep(max(self.interval - elapsed, 0))
+        return stacks, samples, busy
+
+
+def frame_label(code):
+    # Keep the last two path components: enough to tell app/ from the
+    # libraries without making every frame a full site-packages path
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})".replace(";", ":")
+
+
+def collapsed(stacks):
+    """Render stacks in the folded format read by flamegraph.pl and speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def create_profiler(environ=os.environ):
+    # Off unless asked for: the endpoint exposes code paths and file names
+    if environ.get("PROFILING_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return SamplingProfiler(
+        interval=float(environ.get("PROFILE_INTERVAL", "0.01")),
+        max_seconds=float(environ.get("PROFILE_MAX_SECONDS", "60")),
+    )
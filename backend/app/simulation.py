@@ -0,0 +1,289 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class DependencyError(Exception):
+    pass
+
+
+class DependencyTimeout(DependencyError):
+    pass
+
+
+# Latency distributions. Every distribution returns a delay in seconds and
+# can be built from a short spec string such as "uniform:0.2,1.55",
+# "lognormal:0.4,0.6" or "replay:/data/db_latencies.txt".
+
+class UniformLatency:
+    def __init__(self, low, high):
+        self.low = float(low)
+        self.high = float(high)
+        if not 0 <= self.low <= self.high:
+            raise ValueError(f"uniform latency needs 0 <= low <= high, got {low},{high}")
+
+    def sample(self):
+        return random.uniform(self.low, self.high)
+
+    def describe(self):
+        return f"uniform:{self.low},{self.high}"
+
+
+class LogNormalLatency:
+    def __init__(self, median, sigma, cap=None):
+        self.median = float(median)
+        self.sigma = float(sigma)
+        self.cap = float(cap) if cap is not None else None
+        if self.median <= 0 or self.sigma < 0 or (self.cap is not None and self.cap <= 0):
+            raise ValueError("lognormal latency needs median > 0, sigma >= 0 and cap > 0")
+
+    def sample(self):
+        delay = random.lognormvariate(math.log(self.median), self.sigma)
+        if self.cap is not None:
+            delay = min(delay, self.cap)
+        return delay
+
+    def describe(self):
+        spec = f"lognormal:{self.median},{self.sigma}"
+        if self.cap is not None:
+            spec += f",{self.cap}"
+        return spec
+
+
+# Replay files are read whole into memory, so keep them bounded
+MAX_REPLAY_BYTES = 16 * 1024 * 1024
+
+
+class ReplayLatency:
+    """Cycles through latencies recorded one per line (seconds) in a file."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) > MAX_REPLAY_BYTES:
+            raise ValueError(f"Replay files are limited to {MAX_REPLAY_BYTES} bytes")
+        self._samples = array("d")
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip() or line.startswith("#"):
+                    continue
+                # Never echo the line itself: errors are returned to API callers
+                try:
+                    value = float(line)
+                except ValueError:
+                    raise ValueError(f"line {number} is not a number") from None
+                if not math.isfinite(value) or value < 0:
+                    raise ValueError(f"line {number} is not a finite latency >= 0")
+                self._samples.append(value)
+        if not self._samples:
+            raise ValueError(f"No latency samples found in {path}")
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            value = self._samples[self._next]
+            self._next = (self._next + 1) % len(self._samples)
+            return value
+
+    def describe(self):
+        return f"replay:{self.path}"
+
+
+DISTRIBUTIONS = {
+    "uniform": UniformLatency,
+    "lognormal": LogNormalLatency,
+    "replay": ReplayLatency,
+}
+
+# Allowed number of numeric arguments per distribution
+ARITY = {
+    "uniform": (2, 2),
+    "lognormal": (2, 3),
+}
+
+
+def replay_path(path, environ=os.environ):
+    """Resolve a replay file named at runtime, which must live in SIM_REPLAY_DIR."""
+    replay_dir = environ.get("SIM_REPLAY_DIR")
+    if not replay_dir:
+        raise ValueError("Replay files can only be changed at runtime when SIM_REPLAY_DIR is set")
+    root = os.path.realpath(replay_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError("Replay files must be inside SIM_REPLAY_DIR")
+    return resolved
+
+
+def parse_distribution(spec, trusted=True):
+    """Build a latency distribution from its spec string.
+
+    Untrusted specs (those sent to the API) may only replay files from
+    SIM_REPLAY_DIR.
+    """
+    kind, _, args = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution '{kind}'")
+    if kind == "replay":
+        path = args.strip()
+        return ReplayLatency(path if trusted else replay_path(path))
+    try:
+        values = [float(a) for a in args.split(",") if a.strip()]
+    except ValueError:
+        raise ValueError(f"Latency arguments must be numbers, got '{args}'") from None
+    if not all(math.isfinite(value) for value in values):
+        raise ValueError("Latency arguments must be finite")
+    low, high = ARITY[kind]
+    if not low <= len(values) <= high:
+        expected = low if low == high else f"{low} to {high}"
+        raise ValueError(f"{kind} latency takes {expected} arguments, got {len(values)}")
+    return DISTRIBUTIONS[kind](*values)
+
+
+@dataclass
+class DependencyConfig:
+    latency: object
+    error_rate: float = 0.0
+    timeout: Optional[float] = None
+    error_message: str = "Dependency failure"
+
+
+class SimulatedDependency:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+
+    async def call(self):
+        """Await the modeled latency and return it, or raise the modeled failure."""
+        config = self.config
+        delay = config.latency.sample()
+        if config.timeout is not None and delay > config.timeout:
+            await asyncio.sleep(config.timeout)
+            raise DependencyTimeout(f"{self.name} timed out after {config.timeout}s")
+        await asyncio.sleep(delay)
+        if random.random() < config.error_rate:
+            raise DependencyError(config.error_message)
+        return delay
+
+    def configure(self, latency=None, error_rate=None, timeout=None, trusted=True):
+        # Build a new config and swap it in so in-flight calls keep a
+        # consistent view of the settings they started with.
+        # Everything is validated before the swap, so a bad value is rejected
+        # without touching the running config
+        config = self.config
+        if error_rate is not None and not 0 <= float(error_rate) <= 1:
+            raise ValueError(f"error_rate must be between 0 and 1, got {error_rate}")
+        if timeout is not None and not (math.isfinite(float(timeout)) and float(timeout) >= 0):
+            raise ValueError(f"timeout must be a finite number >= 0, got {timeout}")
+        self.config = DependencyConfig(
+            latency=parse_distribution(latency, trusted) if latency is not None else config.latency,
+            error_rate=float(error_rate) if error_rate is not None else config.error_rate,
+            timeout=(float(timeout) or None) if timeout is not None else config.timeout,
+            error_message=config.error_message,
+        )
+
+    def to_dict(self):
+        return {
+            "latency": self.config.latency.describe(),
+            "error_rate": self.config.error_rate,
+            "timeout": self.config.timeout,
+        }
+
+
+DEFAULTS = {
+    "db": DependencyConfig(
+        latency=UniformLatency(0.2, 1.55),
+        error_rate=0.01,
+        error_message="Database connection timeout",
+    ),
+    "recommendation": DependencyConfig(
+        latency=UniformLatency(0.05, 1.25),
+        error_rate=0.01,
+        error_message="External service unavailable",
+    ),
+}
+
+
+def load_dependencies(environ=os.environ):
+    """Build the simulated dependencies, applying SIM_<NAME>_LATENCY,
+    SIM_<NAME>_ERROR_RATE and SIM_<NAME>_TIMEOUT overrides from the environment."""
+    dependencies = {}
+    for name, config in DEFAULTS.items():
+        dependency = SimulatedDependency(name, config)
+        prefix = f"SIM_{name.upper()}_"
+        try:
+            dependency.configure(
+                latency=environ.get(prefix + "LATENCY"),
+                error_rate=environ.get(prefix + "ERROR_RATE"),
+                timeout=environ.get(prefix + "TIMEOUT"),
+            )
+        except ValueError as e:
+            raise ValueError(f"Invalid {prefix}* setting: {e}") from None
+        dependencies[name] = dependency
+    return dependencies
+
+
+class SharedSimulationConfig:
+    """Keeps the dependencies of every worker process in step through one file.
+
+    ``publish()`` atomically writes the local settings to ``path``;
+    ``sync()`` applies the file if it changed since this worker last saw it.
+    """
+
+    def __init__(self, path, dependencies):
+        self.path = path
+        self.dependencies = dependencies
+        self._seen = None
+
+    def publish(self):
+        settings = {name: dependency.to_dict() for name, dependency in self.dependencies.items()}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(settings, f)
+        os.replace(tmp, self.path)
+        self._seen = os.stat(self.path).st_mtime_ns
+
+    def sync(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._seen:
+            return
+        with open(self.path) as f:
+            settings = json.load(f)
+        for name, values in settings.items():
+            if name in self.dependencies:
+                self.dependencies[name].configure(
+                    latency=values["latency"],
+                    error_rate=values["error_rate"],
+                    timeout=values["timeout"] or 0,  # 0 clears the timeout
+                )
+        self._seen = mtime
+
+    async def watch(self, interval=0.5):
+        while True:
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not apply shared simulation config {self.path}: {e}")
+            await asyncio.sleep(interval)
+
+
+def create_shared_config(dependencies, environ=os.environ):
+    """Share dependencies through SIM_CONFIG_PATH, or None for a single process."""
+    path = environ.get("SIM_CONFIG_PATH")
+    if not path:
+        return None
+    shared = SharedSimulationConfig(path, dependencies)
+    # A worker that starts late (or is respawned) picks up earlier changes
+    shared.sync()
+    return shared
@@ -0,0 +1,50 @@
+"""Compare indexed catalog search with the old linear scan.
+
+    cd backend && python -m benchmarks.catalog_search --size 1000000
+"""
+import argparse
+import time
+
+from app.catalog import Catalog
+from benchmarks.generate_catalog import generate_products
+
+QUERIES = ["laptop", "acme", "x20", "wonka drone", "s9999", "pro", "la", "o", "q", "zzz"]
+
+
+def linear_scan(products, query):
+    # What search_products did before the catalog index
+    return [product for product in products if query.lower() in product["name"].lower()]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog search benchmark")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    products = list(generate_products(args.size))
+    start = time.perf_counter()
+    catalog = Catalog(products)
+    print(f"Indexed {len(catalog)} products in {time.perf_counter() - start:.2f}s\n")
+
+    print(f"{'query':<14}{'scan ms':>10}{'index ms':>10}{'speedup':>10}{'matches':>10}")
+    for query in QUERIES:
+        scan_time, matches = timed(lambda: linear_scan(products, query), max(1, args.repeat // 10))
+        index_time, page = timed(lambda: catalog.search(query, limit=args.limit), args.repeat)
+        assert page == matches[:args.limit], query
+        print(
+            f"{query!r:<14}{scan_time * 1000:>10.2f}{index_time * 1000:>10.3f}"
+            f"{scan_time / index_time:>9.0f}x{len(matches):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Generate a synthetic product catalog as JSON Lines.
+
+    cd backend && python -m benchmarks.generate_catalog --size 1000000 --output catalog.jsonl
+    CATALOG_PATH=catalog.jsonl uvicorn app.main:app
+"""
+import argparse
+import json
+import random
+
+ADJECTIVES = [
+    "Ultra", "Pro", "Mini", "Max", "Smart", "Wireless", "Portable", "Classic",
+    "Compact", "Deluxe", "Eco", "Turbo", "Quantum", "Rugged", "Slim", "Vintage",
+]
+BRANDS = [
+    "Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark", "Wayne", "Wonka",
+    "Cyberdyne", "Tyrell", "Aperture", "Soylent", "Vandelay", "Oscorp", "Gringotts",
+]
+NOUNS = [
+    "Laptop", "Smartphone", "Headphones", "Tablet", "Monitor", "Keyboard", "Mouse",
+    "Speaker", "Camera", "Router", "Charger", "Smartwatch", "Printer", "Drone",
+    "Microphone", "Projector", "Earbuds", "Console", "Thermostat", "Doorbell",
+]
+
+
+def generate_products(size, seed=0):
+    rng = random.Random(seed)
+    for product_id in range(1, size + 1):
+        name = (
+            f"{rng.choice(ADJECTIVES)} {rng.choice(BRANDS)} {rng.choice(NOUNS)} "
+            f"{rng.choice('XSZ')}{rng.randint(100, 9999)}"
+        )
+        yield {
+            "id": product_id,
+            "name": name,
+            "price": round(rng.uniform(5, 2500), 2),
+            "stock": rng.randint(0, 500),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic catalog generator")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="catalog.jsonl")
+    args = parser.parse_args()
+
+    with open(args.output, "w") as f:
+        for product in generate_products(args.size, args.seed):
+            f.write(json.dumps(product) + "\n")
+    print(f"Wrote {args.size} products to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
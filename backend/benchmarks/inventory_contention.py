@@ -0,0 +1,116 @@
+"""Contention benchmark for the inventory stores.
+
+Many threads (and, for SQLite, several processes) buy from a small set of
+hot products until the stock runs out. Reports purchases/sec and checks
+that no unit was oversold or lost.
+
+    cd backend && python -m benchmarks.inventory_contention --threads 16 --products 8
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from app.inventory import OutOfStock, ShardedInventory, SQLiteInventory
+
+
+class GlobalLockInventory(ShardedInventory):
+    """Baseline: one lock for every product."""
+
+    def __init__(self, stock):
+        super().__init__(stock, shards=1)
+
+
+def buy_until_sold_out(store, product_ids, sold):
+    count = 0
+    remaining = list(product_ids)
+    i = 0
+    while remaining:
+        product_id = remaining[i % len(remaining)]
+        try:
+            store.reserve(product_id)
+            count += 1
+        except OutOfStock:
+            remaining.remove(product_id)
+        i += 1
+    sold.append(count)
+
+
+def run_threads(store, product_ids, threads):
+    sold = []
+    workers = [
+        threading.Thread(target=buy_until_sold_out, args=(store, product_ids, sold))
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(sold), time.perf_counter() - start
+
+
+def _process_worker(path, stock, threads, results):
+    store = SQLiteInventory(path, stock)
+    results.put(run_threads(store, list(stock), threads)[0])
+
+
+def run_processes(path, stock, processes, threads):
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_process_worker, args=(path, stock, threads, results))
+        for _ in range(processes)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    sold = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return sold, time.perf_counter() - start
+
+
+def report(name, store, stock, sold, elapsed):
+    initial = sum(stock.values())
+    final = sum(store.get_many(stock).values())
+    conserved = final == initial - sold and final >= 0
+    print(
+        f"{name:<22} {sold:>8} sold  {sold / elapsed:>10.0f} purchases/s  "
+        f"final stock {final:>6}  {'OK' if conserved else 'NOT CONSERVED'}"
+    )
+    return conserved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inventory contention benchmark")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--products", type=int, default=8)
+    parser.add_argument("--stock", type=int, default=20000, help="Units per product (in-process stores)")
+    parser.add_argument("--sqlite-stock", type=int, default=500, help="Units per product (SQLite)")
+    args = parser.parse_args()
+
+    ok = True
+    stock = {product_id: args.stock for product_id in range(1, args.products + 1)}
+    for name, store in [
+        ("global lock", GlobalLockInventory(stock)),
+        ("sharded locks", ShardedInventory(stock)),
+    ]:
+        sold, elapsed = run_threads(store, list(stock), args.threads)
+        ok &= report(name, store, stock, sold, elapsed)
+
+    stock = {product_id: args.sqlite_stock for product_id in range(1, args.products + 1)}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inventory.db")
+        store = SQLiteInventory(path, stock)
+        sold, elapsed = run_processes(path, stock, args.processes, args.threads // args.processes or 1)
+        ok &= report(f"sqlite ({args.processes} procs)", store, stock, sold, elapsed)
+
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Check that /metrics reports server-wide totals when running multiple workers.
+
+Starts gunicorn with several workers, spreads requests over them, restarts
+one worker halfway through, and compares the scraped request counter with
+the number of requests that were sent.
+
+    cd backend && python -m benchmarks.multiprocess_metrics --workers 4 --requests 400
+"""
+import argparse
+import collections
+import concurrent.futures
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def scrape_total(url):
+    text = requests.get(f"{url}/metrics", timeout=5).text
+    match = re.search(r'^app_request_count_total\{endpoint="/",status="success"\} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def send(url, count, concurrency):
+    # A fresh connection per request lets the kernel spread them over workers.
+    def one(_):
+        with requests.Session() as session:
+            session.get(f"{url}/", timeout=10).raise_for_status()
+        return 1
+
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        return sum(pool.map(one, range(count)))
+
+
+def worker_pids(master_pid):
+    out = subprocess.run(["pgrep", "-P", str(master_pid)], capture_output=True, text=True).stdout
+    return [int(pid) for pid in out.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker metrics aggregation check")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}"
+    with tempfile.TemporaryDirectory() as multiproc_dir:
+        env = dict(
+            os.environ,
+            PROMETHEUS_MULTIPROC_DIR=multiproc_dir,
+            WEB_CONCURRENCY=str(args.workers),
+            PORT=str(args.port),
+        )
+        server = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "app.main:app"], env=env)
+        try:
+            wait_until_up(f"{url}/metrics")
+            baseline = scrape_total(url)
+
+            sent = send(url, args.requests // 2, concurrency=args.workers * 4)
+            # Kill one worker; its counters must survive in the totals.
+            victim = worker_pids(server.pid)[0]
+            os.kill(victim, signal.SIGKILL)
+            time.sleep(1)
+            wait_until_up(f"{url}/metrics")
+            sent += send(url, args.requests - args.requests // 2, concurrency=args.workers * 4)
+
+            files = collections.Counter(
+                name.rsplit("_", 1)[-1] for name in os.listdir(multiproc_dir)
+            )
+            total = scrape_total(url) - baseline
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"workers:           {args.workers} (killed pid {victim})")
+    print(f"processes written: {len(files)}")
+    print(f"requests sent:     {sent}")
+    print(f"scraped total:     {total:.0f}")
+    if total != sent:
+        print("FAIL: scraped total does not match requests sent")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure time-to-first-request with Tempo present, slow and absent.
+
+A stand-in Tempo readiness endpoint is served locally; "slow" answers after
+a delay and "absent" points at a port nothing listens on.
+
+    cd backend && python -m benchmarks.startup_time
+"""
+import argparse
+import http.server
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_tempo_ready(delay):
+    class ReadyHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"ready")
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ReadyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_to_first_request(tempo_ready_port, timeout):
+    port = free_port()
+    env = dict(
+        os.environ,
+        TEMPO_ENDPOINT=f"127.0.0.1:{free_port()}",
+        TEMPO_READY_PORT=str(tempo_ready_port),
+    )
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/ready", timeout=1)
+                if response.status_code == 200:
+                    return time.perf_counter() - start, response.json()["tracing"]
+            except requests.RequestException:
+                pass
+            time.sleep(0.02)
+        return None, "timed out"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend startup-time benchmark")
+    parser.add_argument("--slow-delay", type=float, default=5.0, help="Seconds the slow Tempo takes to answer")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    present = serve_tempo_ready(0)
+    slow = serve_tempo_ready(args.slow_delay)
+    scenarios = [
+        ("present", present.server_address[1]),
+        ("slow", slow.server_address[1]),
+        ("absent", free_port()),
+    ]
+
+    print(f"{'tempo':<10}{'first request':>16}  tracing at first request")
+    for name, port in scenarios:
+        elapsed, tracing = time_to_first_request(port, args.timeout)
+        shown = f"{elapsed:.2f}s" if elapsed is not None else "-"
+        print(f"{name:<10}{shown:>16}  {tracing}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import glob
+import os
+
+# prometheus_client picks its storage backend at import time, so the
+# multiprocess directory has to be set before anything imports it.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+# PUT /config/simulation writes here and every worker follows the file
+os.environ.setdefault(
+    "SIM_CONFIG_PATH", os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "simulation.json")
+)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+graceful_timeout = 10
+
+
+def on_starting(server):
+    # Metric files left over from a previous run would be added to this
+    # run's totals, so start from an empty directory.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(path, exist_ok=True)
+    for f in glob.glob(os.path.join(path, "*.db")):
+        os.remove(f)
+
+    # Likewise reset the shared inventory so stock starts from the seed data.
+    if os.environ.get("INVENTORY_BACKEND") == "sqlite":
+        for f in glob.glob(os.environ.get("INVENTORY_DB", "/tmp/inventory.db") + "*"):
+            os.remove(f)
+
+    # Simulation overrides from a previous run do not carry over either
+    if os.path.exists(os.environ["SIM_CONFIG_PATH"]):
+        os.remove(os.environ["SIM_CONFIG_PATH"])
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -3,110 +3,440 @@ import aiohttp
 import time
 import random
 import argparse
+import copy
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from rich.console import Console
 from rich.progress import Progress
+from rich.table import Table
 from rich import print as rprint
+from loadtest.arrivals import PROFILES, arrival_times
+from loadtest.histogram import LatencyHistogram
+from loadtest.scenarios import DEFAULT_SCENARIO, load_scenario, replay_schedule
 
 console = Console()
 
-async def make_request(session, url, endpoint):
+# Per-interval histograms are only kept when worker results have to be merged.
+# They are coarsened (~6% precision) and, past MAX_INTERVAL_HISTOGRAMS,
+# neighbouring intervals are combined so a long soak stays in bounded memory
+INTERVAL_BUCKET_BITS = 5
+MAX_INTERVAL_HISTOGRAMS = 360
+
+async def make_request(session, url, request, intended_start=None):
+    # Latency is measured from when the request was supposed to be sent, so
+    # time spent waiting behind slow requests is counted (no coordinated omission)
+    start_time = time.perf_counter() if intended_start is None else intended_start
     try:
-        start_time = time.time()
-        async with session.get(f"{url}{endpoint}") as response:
-            await response.text()
+        async with session.request(
+            request['method'], f"{url}{request['path']}",
+            params=request['params'] or None, json=request['json']
+        ) as response:
+            await response.read()
             return {
                 'status': response.status,
-                'latency': time.time() - start_time,
-                'endpoint': endpoint
+                'latency': time.perf_counter() - start_time,
+                'endpoint': request['name']
             }
     except Exception as e:
         return {
             'status': 'error',
-            'latency': time.time() - start_time,
-            'endpoint': endpoint,
+            'latency': time.perf_counter() - start_time,
+            'endpoint': request['name'],
             'error': str(e)
         }
 
-async def load_test(url, total_requests, concurrent_requests):
-    endpoints = [
-        '/',
-        '/products/1',
-        '/products/2',
-        '/products/3',
-        '/products/999'  # Will cause 404
-    ]
-    
-    results = {
+def make_session(connections):
+    # Reuse keep-alive connections and cache DNS so the generator spends its
+    # CPU on requests, not on handshakes and lookups
+    connector = aiohttp.TCPConnector(
+        limit=connections,
+        limit_per_host=connections,
+        ttl_dns_cache=300,
+        keepalive_timeout=30,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+def new_results(interval_histograms=False):
+    return {
         'success': 0,
         'errors': 0,
-        'latencies': [],
-        'status_codes': {}
+        'dropped': 0,
+        'queued': 0,
+        'status_codes': {},
+        # Latencies are kept in fixed-size histograms, never as raw samples
+        'latency': LatencyHistogram(),
+        'by_endpoint': {},
+        'by_status': {},
+        'interval': LatencyHistogram(),
+        # One fixed-size summary per interval
+        'intervals': [],
+        'interval_histograms': [] if interval_histograms else None
     }
+
+def record_result(results, result):
+    if isinstance(result['status'], int):
+        results['status_codes'][result['status']] = results['status_codes'].get(result['status'], 0) + 1
+        if 200 <= result['status'] < 300:
+            results['success'] += 1
+        else:
+            results['errors'] += 1
+    else:
+        results['errors'] += 1
+    
+    latency = result['latency']
+    results['latency'].record(latency)
+    results['interval'].record(latency)
+    results['by_endpoint'].setdefault(result['endpoint'], LatencyHistogram()).record(latency)
+    results['by_status'].setdefault(str(result['status']), LatencyHistogram()).record(latency)
+
+def take_snapshot(results, elapsed):
+    interval = results['interval']
+    results['intervals'].append(dict(interval.summary(), elapsed=elapsed))
+    histograms = results['interval_histograms']
+    if histograms is not None:
+        histograms.append({'elapsed': elapsed, 'latency': interval.coarsen(INTERVAL_BUCKET_BITS)})
+        if len(histograms) > MAX_INTERVAL_HISTOGRAMS:
+            histograms[:] = compact_intervals(histograms)
+    results['interval'] = LatencyHistogram()
+    return results['intervals'][-1]
+
+def compact_intervals(histograms):
+    # Every worker snapshots on the same interval, so they all compact at the
+    # same point and the n-th entries still line up when merged
+    compacted = []
+    for i in range(0, len(histograms) - 1, 2):
+        first, second = histograms[i], histograms[i + 1]
+        compacted.append({'elapsed': second['elapsed'], 'latency': first['latency'].merge(second['latency'])})
+    if len(histograms) % 2:
+        compacted.append(histograms[-1])
+    return compacted
+
+def format_snapshot(snapshot):
+    return (
+        f"[dim]{snapshot['elapsed']:>7.1f}s[/dim]  {snapshot['count']:>7} req  "
+        f"p50 {snapshot['p50']*1000:>8.1f}ms  p99 {snapshot['p99']*1000:>8.1f}ms  "
+        f"max {snapshot['max']*1000:>8.1f}ms"
+    )
+
+async def report_intervals(results, interval, progress):
+    # Print latency for each interval so drift during long runs is visible
+    start = time.perf_counter()
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = take_snapshot(results, time.perf_counter() - start)
+        if not progress.disable:
+            progress.console.print(format_snapshot(snapshot))
+
+def serialize_results(results):
+    data = {key: results[key] for key in ('success', 'errors', 'dropped', 'queued', 'status_codes')}
+    data['latency'] = results['latency'].to_dict()
+    data['by_endpoint'] = {name: h.to_dict() for name, h in results['by_endpoint'].items()}
+    data['by_status'] = {name: h.to_dict() for name, h in results['by_status'].items()}
+    data['intervals'] = [
+        {'elapsed': snapshot['elapsed'], 'latency': snapshot['latency'].to_dict()}
+        for snapshot in results['interval_histograms'] or []
+    ]
+    return data
+
+def merge_results(serialized):
+    """Combine per-worker results into one, adding counts and histograms."""
+    merged = new_results()
+    intervals = []
+    for data in serialized:
+        for key in ('success', 'errors', 'dropped', 'queued'):
+            merged[key] += data[key]
+        for status, count in data['status_codes'].items():
+            merged['status_codes'][status] = merged['status_codes'].get(status, 0) + count
+        merged['latency'].merge(LatencyHistogram.from_dict(data['latency']))
+        for group in ('by_endpoint', 'by_status'):
+            for name, histogram in data[group].items():
+                merged[group].setdefault(name, LatencyHistogram()).merge(LatencyHistogram.from_dict(histogram))
+        # Workers snapshot on the same interval, so the n-th snapshots line up
+        for i, snapshot in enumerate(data['intervals']):
+            if i == len(intervals):
+                intervals.append({'elapsed': snapshot['elapsed'], 'latency': LatencyHistogram(INTERVAL_BUCKET_BITS)})
+            intervals[i]['latency'].merge(LatencyHistogram.from_dict(snapshot['latency']))
+    merged['intervals'] = [dict(snapshot['latency'].summary(), elapsed=snapshot['elapsed']) for snapshot in intervals]
+    return merged
+
+async def load_test(url, total_requests, concurrent_requests, interval=10, show_progress=True,
+                    scenario=DEFAULT_SCENARIO, interval_histograms=False):
+    results = new_results(interval_histograms)
     
-    async with aiohttp.ClientSession() as session:
-        with Progress() as progress:
+    async with make_session(concurrent_requests) as session:
+        with Progress(disable=not show_progress) as progress:
             task = progress.add_task("[cyan]Running load test...", total=total_requests)
+            reporter = asyncio.create_task(report_intervals(results, interval, progress))
             
             for batch in range(0, total_requests, concurrent_requests):
                 batch_size = min(concurrent_requests, total_requests - batch)
                 tasks = []
                 
                 for _ in range(batch_size):
-                    endpoint = random.choice(endpoints)
-                    tasks.append(make_request(session, url, endpoint))
+                    tasks.append(make_request(session, url, scenario.next_request()))
                 
                 batch_results = await asyncio.gather(*tasks)
                 
                 for result in batch_results:
-                    if isinstance(result['status'], int):
-                        results['status_codes'][result['status']] = results['status_codes'].get(result['status'], 0) + 1
-                        if 200 <= result['status'] < 300:
-                            results['success'] += 1
-                        else:
-                            results['errors'] += 1
-                    else:
-                        results['errors'] += 1
-                    
-                    results['latencies'].append(result['latency'])
+                    record_result(results, result)
                 
                 progress.update(task, advance=batch_size)
                 await asyncio.sleep(0.1)  # Prevent overwhelming the server
+
+            reporter.cancel()
     
     return results
 
+async def open_loop_test(url, schedule, duration, max_in_flight, overflow='queue', interval=10,
+                         show_progress=True, interval_histograms=False):
+    """Send requests on a fixed schedule, whether or not earlier ones finished.
+
+    ``schedule`` yields ``(offset, request)`` pairs: when, in seconds from the
+    start, to send which request. It is consumed lazily.
+
+    At most ``max_in_flight`` requests are outstanding. Requests beyond that
+    either wait for a free slot (``overflow='queue'``, the wait counts toward
+    their latency) or are not sent at all (``overflow='drop'``).
+    """
+    results = new_results(interval_histograms)
+    slots = asyncio.Semaphore(max_in_flight)
+    pending = set()
+
+    async def fire(session, request, intended_start):
+        if slots.locked():
+            results['queued'] += 1
+        async with slots:
+            result = await make_request(session, url, request, intended_start)
+        record_result(results, result)
+
+    async with make_session(max_in_flight) as session:
+        with Progress(disable=not show_progress) as progress:
+            task = progress.add_task("[cyan]Running open-loop test...", total=duration)
+            reporter = asyncio.create_task(report_intervals(results, interval, progress))
+            start = time.perf_counter()
+
+            for offset, request_spec in schedule:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                progress.update(task, completed=min(offset, duration) if duration else offset)
+
+                if overflow == 'drop' and len(pending) >= max_in_flight:
+                    results['dropped'] += 1
+                    continue
+                request = asyncio.create_task(fire(session, request_spec, start + offset))
+                pending.add(request)
+                request.add_done_callback(pending.discard)
+
+            if duration:
+                progress.update(task, completed=duration)
+            if pending:
+                await asyncio.wait(pending)
+            reporter.cancel()
+
+    return results
+
+async def session_test(url, scenario, users, duration, interval=10, show_progress=True,
+                       interval_histograms=False):
+    """Virtual users that each send a session of requests, pausing to think between them."""
+    results = new_results(interval_histograms)
+
+    async def user(session, rng, deadline):
+        while time.perf_counter() < deadline:
+            for _ in range(scenario.session_length):
+                record_result(results, await make_request(session, url, scenario.next_request(rng)))
+                await asyncio.sleep(min(scenario.think(rng), max(deadline - time.perf_counter(), 0)))
+                if time.perf_counter() >= deadline:
+                    return
+
+    async with make_session(users) as session:
+        with Progress(disable=not show_progress) as progress:
+            task = progress.add_task(f"[cyan]Running {users} user sessions...", total=duration)
+            reporter = asyncio.create_task(report_intervals(results, interval, progress))
+            start = time.perf_counter()
+            users_done = asyncio.gather(*(
+                user(session, random.Random(), start + duration) for _ in range(users)
+            ))
+            while not users_done.done():
+                await asyncio.wait([users_done], timeout=0.5)
+                progress.update(task, completed=min(time.perf_counter() - start, duration))
+            reporter.cancel()
+
+    return results
+
 def print_results(results, duration):
     console.print("\n[bold green]Load Test Results[/bold green]")
     console.print(f"Duration: {duration:.2f} seconds")
     console.print(f"Total Requests: {results['success'] + results['errors']}")
     console.print(f"Successful Requests: {results['success']}")
     console.print(f"Failed Requests: {results['errors']}")
+    if results['dropped'] or results['queued']:
+        console.print(f"Dropped Requests (max in-flight reached): {results['dropped']}")
+        console.print(f"Queued Requests (waited for a free slot): {results['queued']}")
+    console.print(f"Throughput: {(results['success'] + results['errors']) / duration:.2f} req/s")
     
-    if results['latencies']:
-        avg_latency = sum(results['latencies']) / len(results['latencies'])
-        p95_latency = sorted(results['latencies'])[int(len(results['latencies']) * 0.95)]
-        console.print(f"Average Latency: {avg_latency*1000:.2f}ms")
-        console.print(f"95th Percentile Latency: {p95_latency*1000:.2f}ms")
+    if results['latency'].count:
+        console.print(f"Average Latency: {results['latency'].mean*1000:.2f}ms")
+        console.print(latency_table("Latency by Endpoint", "Endpoint", results['by_endpoint'], results['latency']))
+        console.print(latency_table("Latency by Status", "Status", results['by_status']))
     
     console.print("\nStatus Code Distribution:")
     for status, count in results['status_codes'].items():
         console.print(f"  {status}: {count}")
 
+def latency_table(title, label, histograms, overall=None):
+    table = Table(title=title, title_justify="left")
+    table.add_column(label, no_wrap=True)
+    for column in ("Count", "p50", "p90", "p99", "p99.9", "Max"):
+        table.add_column(column, justify="right")
+    rows = sorted(histograms.items())
+    if overall is not None:
+        rows.append(("[bold]all[/bold]", overall))
+    for name, histogram in rows:
+        summary = histogram.summary()
+        table.add_row(
+            name, str(summary['count']),
+            *(f"{summary[key]*1000:.1f}ms" for key in ("p50", "p90", "p99", "p99.9", "max"))
+        )
+    return table
+
+def worker_args(args, index):
+    """Give worker ``index`` its share of the requests, rate and connections."""
+    share = copy.copy(args)
+    n = args.workers
+    share.requests = args.requests // n + (1 if index < args.requests % n else 0)
+    share.concurrent = max(1, args.concurrent // n)
+    share.rps = args.rps / n
+    share.start_rps = args.start_rps / n if args.start_rps is not None else None
+    share.step_rps = args.step_rps / n if args.step_rps is not None else None
+    share.max_in_flight = max(1, args.max_in_flight // n)
+    share.users = args.users // n + (1 if index < args.users % n else 0)
+    return share
+
+async def run(args, index=0, show_progress=True):
+    # Workers ship their interval histograms so the parent can merge them
+    interval_histograms = args.workers > 1
+    scenario = load_scenario(args.scenario) if args.scenario else DEFAULT_SCENARIO
+    if args.mode == 'open':
+        rng = random.Random(index)
+        arrivals = arrival_times(
+            args.profile, args.rps, args.duration,
+            start_rps=args.start_rps, step_rps=args.step_rps, step_interval=args.step_interval,
+            seed=index
+        )
+        # Stagger workers so constant-rate schedules do not fire in lockstep
+        phase = index / (args.rps * args.workers)
+        schedule = ((offset + phase, scenario.next_request(rng)) for offset in arrivals)
+        return await open_loop_test(
+            args.url, schedule, args.duration, args.max_in_flight, args.overflow, args.interval,
+            show_progress, interval_histograms
+        )
+    if args.mode == 'replay':
+        schedule = replay_schedule(args.log, args.speedup, index, args.workers)
+        return await open_loop_test(
+            args.url, schedule, None, args.max_in_flight, args.overflow, args.interval, show_progress,
+            interval_histograms
+        )
+    if args.mode == 'sessions':
+        return await session_test(
+            args.url, scenario, args.users, args.duration, args.interval, show_progress, interval_histograms
+        )
+    return await load_test(
+        args.url, args.requests, args.concurrent, args.interval, show_progress, scenario, interval_histograms
+    )
+
+def worker_main(args, index):
+    start_time = time.perf_counter()
+    results = asyncio.run(run(worker_args(args, index), index, show_progress=False))
+    return serialize_results(results), time.perf_counter() - start_time
+
+async def run_workers(args):
+    loop = asyncio.get_running_loop()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        with console.status(f"Running load test on {args.workers} worker processes..."):
+            outcomes = await asyncio.gather(*(
+                loop.run_in_executor(pool, worker_main, args, index) for index in range(args.workers)
+            ))
+    # Report the time spent generating load, not process start-up
+    duration = max(worker_duration for _, worker_duration in outcomes)
+    return merge_results([serialized for serialized, _ in outcomes]), duration
+
+def results_to_json(results, duration, args):
+    total = results['success'] + results['errors']
+    return {
+        'config': vars(args),
+        'duration': duration,
+        'total': total,
+        'success': results['success'],
+        'errors': results['errors'],
+        'dropped': results['dropped'],
+        'queued': results['queued'],
+        'throughput': total / duration,
+        'status_codes': {str(status): count for status, count in results['status_codes'].items()},
+        'latency': results['latency'].summary(),
+        'by_endpoint': {name: h.summary() for name, h in results['by_endpoint'].items()},
+        'by_status': {name: h.summary() for name, h in results['by_status'].items()},
+        'intervals': results['intervals'],
+    }
+
 async def main():
     parser = argparse.ArgumentParser(description='Load Testing Tool')
     parser.add_argument('--url', default='http://localhost:8000', help='Target URL')
     parser.add_argument('--requests', type=int, default=1000, help='Total number of requests')
     parser.add_argument('--concurrent', type=int, default=10, help='Concurrent requests')
+    parser.add_argument('--mode', choices=['closed', 'open', 'sessions', 'replay'], default='closed',
+                        help='closed: fixed batches; open: fixed arrival rate independent of responses; '
+                             'sessions: virtual users with think time; replay: resend a request log')
+    parser.add_argument('--scenario', help='JSON file with the weighted request mix (default: built-in mix)')
+    parser.add_argument('--users', type=int, default=10, help='Virtual users (sessions mode)')
+    parser.add_argument('--log', help='JSON Lines request log to replay (replay mode)')
+    parser.add_argument('--speedup', type=float, default=1.0, help='Replay faster than recorded (replay mode)')
+    parser.add_argument('--rps', type=float, default=50, help='Target requests per second (open mode)')
+    parser.add_argument('--duration', type=float, default=30, help='Test length in seconds (open/sessions mode)')
+    parser.add_argument('--profile', choices=PROFILES, default='constant', help='Arrival profile (open mode)')
+    parser.add_argument('--start-rps', type=float, help='Initial rate for ramp/step profiles (default: 0 for ramp, --step-rps for step)')
+    parser.add_argument('--step-rps', type=float, help='Rate increase per step (step profile)')
+    parser.add_argument('--step-interval', type=float, default=10, help='Seconds per step (step profile)')
+    parser.add_argument('--max-in-flight', type=int, default=1000, help='Outstanding request cap (open/replay mode)')
+    parser.add_argument('--overflow', choices=['queue', 'drop'], default='queue',
+                        help='What to do with requests over the in-flight cap (open/replay mode)')
+    parser.add_argument('--interval', type=float, default=10, help='Seconds between latency snapshots')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Generator processes; requests, rate and connections are split between them')
+    parser.add_argument('--json', help='Also write machine-readable results to this file')
     args = parser.parse_args()
+    if args.mode == 'replay' and not args.log:
+        parser.error('--mode replay needs --log')
 
     console.print(f"[bold]Starting load test against {args.url}[/bold]")
-    console.print(f"Total requests: {args.requests}")
-    console.print(f"Concurrent requests: {args.concurrent}")
-    
-    start_time = time.time()
-    results = await load_test(args.url, args.requests, args.concurrent)
-    duration = time.time() - start_time
+    if args.mode == 'open':
+        console.print(f"Target rate: {args.rps} req/s ({args.profile}) for {args.duration}s")
+        console.print(f"Max in-flight: {args.max_in_flight} ({args.overflow} on overflow)")
+    elif args.mode == 'replay':
+        console.print(f"Replaying {args.log} at {args.speedup}x")
+        console.print(f"Max in-flight: {args.max_in_flight} ({args.overflow} on overflow)")
+    elif args.mode == 'sessions':
+        console.print(f"Virtual users: {args.users} for {args.duration}s")
+    else:
+        console.print(f"Total requests: {args.requests}")
+        console.print(f"Concurrent requests: {args.concurrent}")
+    if args.workers > 1:
+        console.print(f"Worker processes: {args.workers}")
+
+    if args.workers > 1:
+        results, duration = await run_workers(args)
+    else:
+        start_time = time.perf_counter()
+        results = await run(args)
+        duration = time.perf_counter() - start_time
     
     print_results(results, duration)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results_to_json(results, duration, args), f, indent=2)
+        console.print(f"\nResults written to {args.json}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+import itertools
+import math
+import random
+
+PROFILES = ("constant", "ramp", "step", "poisson")
+
+
+def arrival_times(profile, rps, duration, start_rps=None, step_rps=None, step_interval=10.0, seed=None):
+    """Yield the intended send time of each request, in seconds from the start.
+
+    The schedule depends only on the target rate, never on how fast the
+    server answers, so a slow response cannot delay the requests after it.
+
+    - constant: ``rps`` requests per second
+    - ramp: rate grows linearly from ``start_rps`` to ``rps`` over ``duration``
+    - step: rate starts at ``start_rps`` and grows by ``step_rps`` every
+      ``step_interval`` seconds, capped at ``rps``
+
+    Without ``start_rps`` a ramp starts at 0 and a step schedule at
+    ``step_rps``.
+    - poisson: exponential gaps averaging ``rps`` requests per second
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown arrival profile '{profile}'")
+    rng = random.Random(seed)
+    if start_rps is None:
+        # Ramps start from idle; step schedules start at their first step
+        start_rps = 0.0 if profile == "ramp" else (step_rps or rps / 10) if profile == "step" else rps
+    step_rps = step_rps or rps / 10
+
+    def due(count):
+        # Invert the cumulative rate: the time by which ``count`` requests
+        # should have been sent, or None if that never happens
+        if profile == "ramp":
+            slope = (rps - start_rps) / duration
+            if slope == 0:
+                return count / start_rps if start_rps > 0 else None
+            # Solve start_rps * t + slope * t**2 / 2 = count
+            discriminant = start_rps ** 2 + 2 * slope * count
+            if discriminant < 0:
+                return None
+            return max(0.0, (math.sqrt(discriminant) - start_rps) / slope)
+        if profile == "step":
+            begin, sent = 0.0, 0.0
+            for step in itertools.count():
+                current = min(rps, start_rps + step_rps * step)
+                end = math.inf if current >= rps else begin + step_interval
+                if current > 0 and sent + current * (end - begin) > count:
+                    return begin + (count - sent) / current
+                if end == math.inf or begin >= duration:
+                    return None
+                sent += current * (end - begin)
+                begin = end
+        return count / rps if rps > 0 else None
+
+    count = 0.0
+    while True:
+        t = due(count)
+        if t is None or t >= duration:
+            return
+        yield t
+        # Poisson arrivals are unit-rate exponential gaps in cumulative count
+        count += rng.expovariate(1.0) if profile == "poisson" else 1.0
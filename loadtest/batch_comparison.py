@@ -0,0 +1,99 @@
+"""Compare fetching a page of products one by one against one bulk request.
+
+Each virtual client repeatedly loads a "page" of ``--page-size`` random
+products, either as that many concurrent ``GET /products/{id}`` calls or as a
+single ``GET /products?ids=...``, for ``--duration`` seconds per mode. The
+defaults fit the three sample products; with a generated catalog raise
+``--ids`` to its size.
+
+    python -m loadtest.batch_comparison --url http://localhost:8000 --ids 1000 --page-size 10
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+from load_test import make_request, make_session
+from loadtest.histogram import LatencyHistogram
+
+
+def page_requests(mode, product_ids):
+    if mode == 'per-item':
+        return [
+            {'method': 'GET', 'path': f"/products/{product_id}", 'params': {}, 'json': None,
+             'name': 'GET /products/{id}'}
+            for product_id in product_ids
+        ]
+    return [{
+        'method': 'GET', 'path': '/products',
+        'params': {'ids': ','.join(map(str, product_ids))}, 'json': None,
+        'name': 'GET /products',
+    }]
+
+
+async def run_mode(url, mode, page_size, id_range, clients, duration, seed):
+    rng = random.Random(seed)
+    histogram = LatencyHistogram()
+    stats = {'pages': 0, 'requests': 0, 'errors': 0}
+    deadline = time.perf_counter() + duration
+
+    async def client(session):
+        while time.perf_counter() < deadline:
+            product_ids = rng.sample(range(1, id_range + 1), page_size)
+            start = time.perf_counter()
+            results = await asyncio.gather(*(
+                make_request(session, url, request) for request in page_requests(mode, product_ids)
+            ))
+            histogram.record(time.perf_counter() - start)
+            stats['pages'] += 1
+            stats['requests'] += len(results)
+            stats['errors'] += sum(1 for result in results if result['status'] != 200)
+
+    start = time.perf_counter()
+    async with make_session(clients * page_size) as session:
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+    stats['elapsed'] = time.perf_counter() - start
+    stats['latency'] = histogram
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Batched vs per-item product fetch throughput')
+    parser.add_argument('--url', default='http://localhost:8000', help='Target URL')
+    parser.add_argument('--page-size', type=int, default=3, help='Products per page load')
+    parser.add_argument('--ids', type=int, default=3, help='Pick product ids from 1..N')
+    parser.add_argument('--concurrent', type=int, default=10, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per mode')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.page_size > args.ids:
+        parser.error('--page-size cannot exceed --ids')
+
+    console = Console()
+    table = Table(title=f"Pages of {args.page_size} products, {args.concurrent} clients")
+    for column in ('Mode', 'Pages/s', 'Products/s', 'HTTP requests/s', 'Errors',
+                   'Page p50 (ms)', 'Page p99 (ms)'):
+        table.add_column(column, justify='left' if column == 'Mode' else 'right')
+
+    for mode in ('per-item', 'batched'):
+        console.print(f"Running {mode} for {args.duration:.0f}s...")
+        stats = await run_mode(args.url, mode, args.page_size, args.ids,
+                               args.concurrent, args.duration, args.seed)
+        elapsed = stats['elapsed']
+        table.add_row(
+            mode,
+            f"{stats['pages'] / elapsed:.1f}",
+            f"{stats['pages'] * args.page_size / elapsed:.1f}",
+            f"{stats['requests'] / elapsed:.1f}",
+            str(stats['errors']),
+            f"{stats['latency'].percentile(50) * 1000:.1f}",
+            f"{stats['latency'].percentile(99) * 1000:.1f}",
+        )
+    console.print(table)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
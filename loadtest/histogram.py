@@ -0,0 +1,109 @@
+class LatencyHistogram:
+    """Constant-memory latency histogram with HDR-style log buckets.
+
+    Values are recorded in microseconds. Each power-of-two range is split
+    into ``2 ** (sub_bucket_bits - 1)`` linear sub-buckets, so every
+    reported percentile is within ``2 ** -(sub_bucket_bits - 1)`` (under 1%
+    by default) of the true value, however many samples are recorded.
+    Histograms with the same precision can be merged by adding their counts.
+    """
+
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return (shift * self._half) + (value >> shift)
+
+    def _highest_value(self, index):
+        shift = max(index // self._half - 1, 0)
+        mantissa = index - shift * self._half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(int(seconds * 1_000_000), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Cannot merge histograms with different precision")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def coarsen(self, sub_bucket_bits):
+        """Return a copy at lower precision, with fewer buckets to keep or ship."""
+        histogram = LatencyHistogram(sub_bucket_bits)
+        for index, count in self.counts.items():
+            target = histogram._index(self._highest_value(index))
+            histogram.counts[target] = histogram.counts.get(target, 0) + count
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.min = self.min
+        histogram.max = self.max
+        return histogram
+
+    def percentile(self, percent):
+        """Return the latency (seconds) at or below which ``percent`` of samples fall."""
+        if not self.count:
+            return 0.0
+        threshold = max(self.count * percent / 100, 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(self._highest_value(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    @property
+    def mean(self):
+        return self.total / self.count / 1_000_000 if self.count else 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p99.9': self.percentile(99.9),
+            'max': self.max / 1_000_000,
+        }
+
+    def to_dict(self):
+        return {
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'counts': self.counts,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['sub_bucket_bits'])
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
@@ -0,0 +1,120 @@
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def pick(value, rng):
+    # Lists in a scenario mean "choose one per request"
+    return rng.choice(value) if isinstance(value, list) else value
+
+
+@dataclass
+class RequestSpec:
+    method: str
+    path: str
+    weight: float = 1.0
+    name: Optional[str] = None
+    params: dict = field(default_factory=dict)
+    body: Optional[dict] = None
+    vars: dict = field(default_factory=dict)
+
+    def build(self, rng):
+        values = {key: pick(value, rng) for key, value in self.vars.items()}
+        return {
+            'method': self.method.upper(),
+            'path': self.path.format(**values),
+            'params': {key: pick(value, rng) for key, value in self.params.items()},
+            'json': self.body,
+            'name': self.name or f"{self.method.upper()} {self.path}",
+        }
+
+
+@dataclass
+class Scenario:
+    """A weighted mix of requests, plus how virtual users pace themselves."""
+
+    requests: list
+    think_time: tuple = (0.0, 0.0)
+    session_length: int = 10
+
+    def __post_init__(self):
+        self._weights = [spec.weight for spec in self.requests]
+
+    def next_request(self, rng=random):
+        return rng.choices(self.requests, weights=self._weights)[0].build(rng)
+
+    def think(self, rng=random):
+        return rng.uniform(*self.think_time)
+
+
+PRODUCT_IDS = [1, 2, 3]
+
+DEFAULT_SCENARIO = Scenario(
+    requests=[
+        RequestSpec('GET', '/', weight=1),
+        RequestSpec('GET', '/products/{product_id}', weight=6, vars={'product_id': PRODUCT_IDS}),
+        RequestSpec('GET', '/products/{product_id}', weight=1, name='GET /products/{missing}',
+                    vars={'product_id': [999]}),
+        RequestSpec('GET', '/products/search', weight=2,
+                    params={'query': ['lap', 'phone', 'head', 'o', 'zzz']}),
+        RequestSpec('POST', '/products/{product_id}/purchase', weight=1, vars={'product_id': PRODUCT_IDS}),
+    ],
+    think_time=(0.5, 2.0),
+    session_length=10,
+)
+
+
+def load_scenario(path):
+    """Read a scenario from JSON; see loadtest/example_scenario.json."""
+    with open(path) as f:
+        data = json.load(f)
+    return Scenario(
+        requests=[RequestSpec(**spec) for spec in data['requests']],
+        think_time=tuple(data.get('think_time', (0.0, 0.0))),
+        session_length=data.get('session_length', 10),
+    )
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def replay_schedule(path, speedup=1.0, worker=0, workers=1):
+    """Stream (offset, request) pairs from a JSON Lines request log.
+
+    Each line needs ``timestamp`` (epoch seconds or ISO 8601), ``method`` and
+    ``path``; ``params`` and ``body`` are optional. Offsets keep the original
+    spacing divided by ``speedup``. The file is read one line at a time, so
+    logs of any size replay in constant memory. With several workers each
+    takes every ``workers``-th line.
+    """
+    first = None
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            if first is None:
+                # Every worker measures offsets from the log's first entry
+                first = _timestamp(json.loads(line)['timestamp'])
+            if number % workers != worker:
+                continue
+            entry = json.loads(line)
+            timestamp = _timestamp(entry['timestamp'])
+            method = entry.get('method', 'GET').upper()
+            request_path = entry['path']
+            yield (timestamp - first) / speedup, {
+                'method': method,
+                'path': request_path,
+                'params': entry.get('params') or {},
+                'json': entry.get('body'),
+                # Group /products/123 and /products/456 together so the
+                # per-endpoint histograms stay bounded
+                'name': f"{method} {NUMERIC_SEGMENT.sub('/{id}', request_path.split('?')[0])}",
+            }